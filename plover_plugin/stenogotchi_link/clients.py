@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
+import string
 import plover.log
 import dbus, dbus.exceptions
 from dbus.mainloop.glib import DBusGMainLoop
 
-from time import sleep
-from threading import Thread
+from time import monotonic
+from threading import Thread, Lock
 from gi.repository import GLib
 
 from Xlib import X, XK
@@ -17,15 +18,42 @@ SERVER_DBUS = 'com.github.stenogotchi'
 SERVER_SRVC = '/com/github/stenogotchi'
 ERROR_NO_SERVER: str = 'A server is not currently running'
 ERROR_SERVER_RUNNING: str = 'A server is already running'
-TIME_SLEEP = 0
+# Number of unanswered async D-Bus calls after which droppable messages (stats updates) are discarded
+MAX_PENDING_CALLS = 32
+# Seconds after which a reply to an async D-Bus call is counted as late
+LATE_REPLY_SECONDS = 0.5
+# Seconds between debug log entries of the async D-Bus call stats
+CALL_STATS_LOG_INTERVAL = 300
+# Size of a single HID report as sent over the BT interrupt channel: 0xA1, report id, modifiers, reserved and six keys
+HID_REPORT_LENGTH = 10
+# Maximum number of simultaneously pressed normal keys in a report
+HID_ROLLOVER = 6
+# Characters for which HID reports are precompiled whenever the keymap is (re)built
+PRECOMPILED_CHARS = string.ascii_letters + string.digits + string.punctuation + ' \n\t'
 
 
 class StenogotchiClient:
     """ 
     Transmits Plover event updates to, and listens for signals from, Stenogotchi over D-Bus.
+
+    With async_calls enabled, method calls return immediately and replies are
+    handled on the D-Bus mainloop thread, so Plover's engine thread never waits
+    on Stenogotchi. Messages keep their order as they share one bus connection.
     """
-    def __init__(self, engineserver):
+    def __init__(self, engineserver, async_calls=True):
         self._engineserver = engineserver
+        self.async_calls = async_calls
+        self._stats_lock = Lock()
+        self._call_stats = {
+            'queue_depth': 0,       # calls sent but not yet answered
+            'max_queue_depth': 0,
+            'sent': 0,
+            'dropped': 0,           # droppable calls discarded due to back-pressure
+            'late': 0,              # replies received after LATE_REPLY_SECONDS
+            'failed': 0,
+        }
+        self._dropped_in_burst = 0
+        self._stats_logged_at = monotonic()
         self._setup_dbus_loop()
         self._setup_object()
     
@@ -52,38 +80,102 @@ class StenogotchiClient:
     def _exit(self):
         self._mainloop.quit()
 
+    def _call(self, method_name, *args, droppable=False):
+        """
+        Calls method_name on the Stenogotchi service. In async mode the call does
+        not block, and droppable calls are discarded while too many are pending.
+        """
+        method = getattr(self.stenogotchi_service, method_name)
+        if not self.async_calls:
+            method(*args)
+            return
+
+        with self._stats_lock:
+            dropped = droppable and self._call_stats['queue_depth'] >= MAX_PENDING_CALLS
+            if dropped:
+                self._call_stats['dropped'] += 1
+                self._dropped_in_burst += 1
+                dropped_in_burst = self._dropped_in_burst
+            else:
+                dropped_in_burst, self._dropped_in_burst = self._dropped_in_burst, 0
+                self._call_stats['sent'] += 1
+                self._call_stats['queue_depth'] += 1
+                self._call_stats['max_queue_depth'] = max(self._call_stats['max_queue_depth'], self._call_stats['queue_depth'])
+            log_stats = monotonic() - self._stats_logged_at > CALL_STATS_LOG_INTERVAL
+            if log_stats:
+                self._stats_logged_at = monotonic()
+
+        if log_stats:
+            plover.log.debug(f'[stenogotchi_link] D-Bus call stats: {self.get_call_stats()}')
+        if dropped:
+            # Only the first drop of a burst is logged, the total follows once calls go through again
+            if dropped_in_burst == 1:
+                plover.log.warning(f'[stenogotchi_link] {MAX_PENDING_CALLS} D-Bus calls pending, dropping stats updates such as {method_name} until Stenogotchi catches up')
+            return
+        if dropped_in_burst:
+            plover.log.info(f'[stenogotchi_link] Stenogotchi caught up, {dropped_in_burst} stats updates were dropped')
+
+        sent_at = monotonic()
+        method(*args,
+               reply_handler=lambda *reply: self._on_call_reply(method_name, sent_at),
+               error_handler=lambda e: self._on_call_error(method_name, sent_at, e))
+
+    def _on_call_reply(self, method_name, sent_at):
+        delay = monotonic() - sent_at
+        with self._stats_lock:
+            self._call_stats['queue_depth'] -= 1
+            if delay > LATE_REPLY_SECONDS:
+                self._call_stats['late'] += 1
+        if delay > LATE_REPLY_SECONDS:
+            plover.log.debug(f'[stenogotchi_link] Late reply to {method_name} after {delay:.3f}s')
+
+    def _on_call_error(self, method_name, sent_at, e):
+        with self._stats_lock:
+            self._call_stats['queue_depth'] -= 1
+            self._call_stats['failed'] += 1
+        plover.log.error(f'[stenogotchi_link] D-Bus call {method_name} failed: {str(e)}')
+
+    def get_call_stats(self):
+        """ Returns back-pressure metrics of async D-Bus calls """
+        with self._stats_lock:
+            return dict(self._call_stats)
+
     def plover_is_running(self, b):
+        # Sent synchronously so the message is delivered before the mainloop quits
         self.stenogotchi_service.plover_is_running(b)
         # If plover is shutting down, quit mainloop
         if not b:
+            if self.async_calls:
+                plover.log.info(f'[stenogotchi_link] D-Bus call stats: {self.get_call_stats()}')
             self._exit()
 
     def plover_is_ready(self, b):
-        self.stenogotchi_service.plover_is_ready(b)
+        self._call('plover_is_ready', b)
 
     def plover_machine_state(self, s):
-        self.stenogotchi_service.plover_machine_state(s)
+        # Not droppable, a lost state change would show until the next one
+        self._call('plover_machine_state', s)
 
     def plover_output_enabled(self, b):
-        self.stenogotchi_service.plover_output_enabled(b)
+        self._call('plover_output_enabled', b)
 
     def plover_wpm_stats(self, s):
-        self.stenogotchi_service.plover_wpm_stats(s)
+        self._call('plover_wpm_stats', s, droppable=True)
 
     def plover_strokes_stats(self, s):
-        self.stenogotchi_service.plover_strokes_stats(s)
+        self._call('plover_strokes_stats', s, droppable=True)
 
     def send_backspaces(self, y):
-        self.stenogotchi_service.send_backspaces_stenogotchi(y)
+        self._call('send_backspaces_stenogotchi', y)
 
     def send_string(self, s):
-        self.stenogotchi_service.send_string_stenogotchi(s)
+        self._call('send_string_stenogotchi', s)
 
     def send_key_combination(self, s):
-        self.stenogotchi_service.send_key_combination_stenogotchi(s)
+        self._call('send_key_combination_stenogotchi', s)
 
     def send_lookup_results(self, l):
-        self.stenogotchi_service.plover_translation_handler(l)
+        self._call('plover_translation_handler', l)
 
     def stenogotchi_signal_handler(self, dict):
         # Enable and disable wpm/strokes meters
@@ -93,16 +185,24 @@ class StenogotchiClient:
             self._engineserver.lookup_stroke(dict['lookup_stroke'])
         if 'output_to_stenogotchi' in dict:
             self._engineserver._output_to_stenogotchi = dict['output_to_stenogotchi']
+        if 'hid_rollover' in dict:
+            self._engineserver._btclient.rollover = bool(dict['hid_rollover'])
         if 'start_wpm_meter' in dict:
             wpm_method = dict['wpm_method']
             wpm_timeout = int(dict['wpm_timeout'])
+            publishing = {
+                'wpm_publish': dict.get('wpm_publish', 'interval'),
+                'wpm_publish_interval': int(dict.get('wpm_publish_interval', 10)),
+                'wpm_publish_delta': float(dict.get('wpm_publish_delta', 0)),
+                'strokes_publish_delta': float(dict.get('strokes_publish_delta', 0)),
+            }
             plover.log.info('[stenogotchi_link] Starting WPM meter')
             if dict['start_wpm_meter'] == 'wpm and strokes':
-                self._engineserver.start_wpm_meter(enable_wpm=True, enable_strokes=True, wpm_method=wpm_method, wpm_timeout=wpm_timeout)
+                self._engineserver.start_wpm_meter(enable_wpm=True, enable_strokes=True, wpm_method=wpm_method, wpm_timeout=wpm_timeout, **publishing)
             elif dict['start_wpm_meter'] == 'wpm':
-                self._engineserver.start_wpm_meter(enable_wpm=True, enable_strokes=False, wpm_method=wpm_method, wpm_timeout=wpm_timeout)
+                self._engineserver.start_wpm_meter(enable_wpm=True, enable_strokes=False, wpm_method=wpm_method, wpm_timeout=wpm_timeout, **publishing)
             elif dict['start_wpm_meter'] == 'strokes':
-                self._engineserver.start_wpm_meter(enable_wpm=False, enable_strokes=True, wpm_method=wpm_method, wpm_timeout=wpm_timeout)
+                self._engineserver.start_wpm_meter(enable_wpm=False, enable_strokes=True, wpm_method=wpm_method, wpm_timeout=wpm_timeout, **publishing)
         if 'stop_wpm_meter' in dict:
             plover.log.info('[stenogotchi_link] Stopping WPM meter')
             if dict['stop_wpm_meter'] == 'wpm and strokes':
@@ -118,6 +218,9 @@ class CustomKeyboardEmulation(KeyboardEmulation):
     to prefer lower keycode rather than low modkeys combos in mapping.
     This way we avoid some issues when mapping to BT HID keycodes.
     """
+    # Incremented on every keymap rebuild so that clients can invalidate cached mappings
+    keymap_version = 0
+
     def _update_keymap(self):
         '''Analyse keymap, build a mapping of keysym to (keycode + modifiers),
         and find unused keycodes that can be used for unmapped keysyms.
@@ -171,6 +274,7 @@ class CustomKeyboardEmulation(KeyboardEmulation):
         assert self._backspace_mapping.custom_mapping is None
         # Get modifier mapping.
         self.modifier_mapping = self._display.get_modifier_mapping()
+        self.keymap_version += 1
 
 class BTClient:
     """
@@ -179,13 +283,17 @@ class BTClient:
     def __init__(self):
         self.target_length = 6
         self.mod_keys = 0b00000000
-        self.pressed_keys = []
+        self.pressed_keys = [0] * self.target_length
         self.bus = dbus.SystemBus()
         self.btkobject = self.bus.get_object(SERVER_DBUS, SERVER_SRVC)
         self.btk_service = dbus.Interface(self.btkobject, SERVER_DBUS)
         self.ke = CustomKeyboardEmulation()
-        self._backspace_mapping_hid = plover_convert(self.ke._backspace_mapping.keycode)
-
+        self.buffered_transport = True
+        self.rollover = True
+        self._keymap_version = None
+        self._char_reports = {}
+        self._backspace_reports = ()
+        self._update_char_reports()
 
     def update_mod_keys(self, mod_key, value):
         """
@@ -221,35 +329,90 @@ class BTClient:
     @property
     def state(self):
         """
-        property with the HID message to be sent
+        property with the HID message to be sent, always HID_REPORT_LENGTH long
         :return: bytes of HID message
         """
-        return [0xA1, 0x01, self.mod_keys, 0, *self.pressed_keys]
+        keys = self.pressed_keys[:self.target_length]
+        return [0xA1, 0x01, self.mod_keys, 0, *keys, *[0] * (self.target_length - len(keys))]
 
     def clear_mod_keys(self):
         self.mod_keys = 0b00000000
 
     def clear_keys(self):
-        self.pressed_keys = []
+        self.pressed_keys = [0] * self.target_length
 
     def send_keys(self, state_list=None):
         if not state_list:
             self.btk_service.send_keys([state_list])
+        elif self.buffered_transport:
+            self.send_keys_buffer(state_list)
         else:
             flat_list = state_list
             self.btk_service.send_keys(flat_list)
 
-    def send_backspaces(self, number_of_backspaces):
+    def send_keys_buffer(self, state_list):
+        """
+        Packs all HID reports into one contiguous buffer and sends it as a single
+        byte array, saving the per-report marshalling of send_keys. Falls back to
+        send_keys if the running Stenogotchi does not provide send_keys_buffer.
+        """
+        buf = b''.join(map(bytes, state_list))
+        if len(buf) % HID_REPORT_LENGTH:
+            plover.log.error(f'[stenogotchi_link] Not sending HID buffer of {len(buf)} bytes, not a multiple of {HID_REPORT_LENGTH}: {state_list}')
+            return
+        try:
+            self.btk_service.send_keys_buffer(dbus.ByteArray(buf))
+        except dbus.exceptions.DBusException as e:
+            if e.get_dbus_name() != 'org.freedesktop.DBus.Error.UnknownMethod':
+                raise
+            plover.log.info('[stenogotchi_link] Stenogotchi does not support send_keys_buffer, falling back to send_keys')
+            self.buffered_transport = False
+            self.btk_service.send_keys(state_list)
+
+    def _update_char_reports(self):
+        """
+        Precompiles the press/release HID reports of common characters and
+        backspace for the current keymap. Other characters are compiled and
+        added to the table the first time they are sent.
+        """
+        self._keymap_version = self.ke.keymap_version
+        self._char_reports = {}
+        for char in PRECOMPILED_CHARS:
+            self._char_reports[char] = self._compile_char(char)
+
         self.clear_keys()
         self.clear_mod_keys()
-        state_list = []
-        for x in range(number_of_backspaces):
-            self.update_keys(self._backspace_mapping_hid, 1)
-            state_list.append(self.state)
-            self.update_keys(self._backspace_mapping_hid, 0)
-            state_list.append(self.state)
-        self.send_keys(state_list)
-        
+        backspace_hid = plover_convert(self.ke._backspace_mapping.keycode)
+        self.update_keys(backspace_hid, 1)
+        press = bytes(self.state)
+        self.update_keys(backspace_hid, 0)
+        release = bytes(self.state)
+        self._backspace_reports = (press, release)
+
+    def _compile_char(self, char):
+        """ Returns a tuple of HID reports (bytes) typing char, empty if it can't be mapped """
+        keysym = uchr_to_keysym(char)
+        mapping = self.ke._get_mapping(keysym)
+        #plover.log.debug(f"[stenogotchi_link] mapping : '{mapping}' mapping.keycode : '{mapping.keycode}' and mapping.modifier : '{mapping.modifiers}' (for keysym : '{keysym}' given char : '{char}')")
+        if mapping is None:
+            return ()
+        sublist = self.map_hid_events(mapping.keycode, mapping.modifiers)
+        if not sublist:
+            return ()
+        return tuple(bytes(state) for state in sublist)
+
+    def _get_char_reports(self, char):
+        reports = self._char_reports.get(char)
+        if reports is None:
+            reports = self._compile_char(char)
+            self._char_reports[char] = reports
+        return reports
+
+    def send_backspaces(self, number_of_backspaces):
+        if self.ke.keymap_version != self._keymap_version:
+            self._update_char_reports()
+        self.send_keys(list(self._backspace_reports * number_of_backspaces))
+
 
     def map_hid_events(self, keycode, modifiers=None):
         """ Returns a list of HID bytearrays to produce the key combination.
@@ -284,6 +447,7 @@ class BTClient:
             modkey_hid = plover_modkey(modifiers)
             if modkey_hid < 0:
                 plover.log.error(f"[stenogotchi_link] Unable to map keycode: {keycode} using plover_modkey in keymap.py.")
+                return
 
         # Apply modifiers
         if modifiers:
@@ -292,7 +456,6 @@ class BTClient:
         # Press and release the base key.
         self.update_keys(normkey_hid, 1)
         state_sublist.append(self.state)
-        sleep(TIME_SLEEP)
         self.update_keys(normkey_hid, 0)
         state_sublist.append(self.state)
         # Release modifiers
@@ -305,17 +468,53 @@ class BTClient:
         #    self.update_mod_keys(plover_modkey(mod_keycode), 0)
         
     
-    def send_string(self, s):
+    def encode_string(self, s):
+        """
+        Returns the HID reports typing s. With rollover enabled, runs of distinct
+        characters sharing the same modifiers are pressed one after the other
+        while the previous keys stay held (up to HID_ROLLOVER keys) and released
+        together, so a run of n characters takes n + 1 reports instead of 2n.
+        Repeated characters start a new run, and single character runs use the
+        regular press/release reports.
+        """
         state_list = []
+        if not self.rollover:
+            for char in s:
+                state_list.extend(self._get_char_reports(char))
+            return state_list
+
+        run = []    # precompiled reports of each character in the current run
         for char in s:
-            keysym = uchr_to_keysym(char)
-            mapping = self.ke._get_mapping(keysym)
-            #plover.log.debug(f"[stenogotchi_link] mapping : '{mapping}' mapping.keycode : '{mapping.keycode}' and mapping.modifier : '{mapping.modifiers}' (for keysym : '{keysym}' given char : '{char}')")
-            if mapping is None:
+            reports = self._get_char_reports(char)
+            if not reports:
                 continue
-            sublist = self.map_hid_events(mapping.keycode, mapping.modifiers)
-            if sublist:
-                state_list.extend(sublist)
+            press = reports[0]
+            if run and (press[2] != run[0][0][2] or len(run) == HID_ROLLOVER
+                        or any(press[4] == held[0][4] for held in run)):
+                self._flush_run(run, state_list)
+            run.append(reports)
+        self._flush_run(run, state_list)
+        return state_list
+
+    @staticmethod
+    def _flush_run(run, state_list):
+        if len(run) == 1:
+            state_list.extend(run[0])
+        elif run:
+            header = run[0][0][:4]
+            keys = []
+            for reports in run:
+                # Newest key first, as in update_keys
+                keys.insert(0, reports[0][4])
+                state_list.append(header + bytes(keys) + bytes(HID_ROLLOVER - len(keys)))
+            # Release of the keys and, if any were held, the modifiers
+            state_list.extend(run[-1][1:])
+        run.clear()
+
+    def send_string(self, s):
+        if self.ke.keymap_version != self._keymap_version:
+            self._update_char_reports()
+        state_list = self.encode_string(s)
         if len(state_list) > 0:
             self.send_keys(state_list)
         
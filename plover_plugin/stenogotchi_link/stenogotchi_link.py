@@ -15,7 +15,7 @@ from plover.formatting import _Action
 from plover.steno_dictionary import StenoDictionaryCollection
 
 from stenogotchi_link.clients import BTClient, StenogotchiClient
-from stenogotchi_link.wpm import PloverWpmMeter, PloverStrokesMeter
+from stenogotchi_link.wpm import PloverMeterEngine, PloverWpmMeter, PloverStrokesMeter
 
 
 ERROR_MISSING_ENGINE = 'Plover engine not provided'
@@ -31,8 +31,7 @@ class EngineServer():
         self._engine: StenoEngine = engine
         self._stenogotchiclient = StenogotchiClient(self)
         self._btclient = BTClient()
-        self._wpm_meter = None
-        self._strokes_meter = None
+        self._meter_engine = None
         self._output_to_stenogotchi = False
 
     # Started when user enables extension
@@ -46,23 +45,43 @@ class EngineServer():
     def stop(self):
         """ Stops the server. """
         self._disconnect_hooks()
+        self.stop_wpm_meter()
         self._stenogotchiclient.plover_is_running(False)
 
-    def start_wpm_meter(self, enable_wpm=False, enable_strokes=False, wpm_method='ncra', wpm_timeout=60):
-        """ Starts WPM and/or Strokes meters
+    def start_wpm_meter(self, enable_wpm=False, enable_strokes=False, wpm_method='ncra', wpm_timeout=60,
+                        wpm_publish='interval', wpm_publish_interval=10, wpm_publish_delta=0, strokes_publish_delta=0):
+        """ Starts WPM and/or Strokes meters on a shared meter engine
         """
+        if not enable_wpm and not enable_strokes:
+            return
+        if self._meter_engine and self._meter_engine.timeout != wpm_timeout:
+            # Window lengths changed, carry the running meters over to a new engine
+            meters = self._meter_engine.get_meters()
+            self._meter_engine.quit()
+            self._meter_engine = PloverMeterEngine(timeout=wpm_timeout, publish=wpm_publish, publish_interval=wpm_publish_interval)
+            for name, meter in meters.items():
+                self._meter_engine.add_meter(name, meter)
+        elif not self._meter_engine:
+            self._meter_engine = PloverMeterEngine(timeout=wpm_timeout, publish=wpm_publish, publish_interval=wpm_publish_interval)
+        else:
+            self._meter_engine.set_publishing(wpm_publish, wpm_publish_interval)
         if enable_wpm:
-            self._wpm_meter = PloverWpmMeter(stenogotchi_link=self, wpm_method=wpm_method, timeout=wpm_timeout)
+            self._meter_engine.add_meter('wpm', PloverWpmMeter(stenogotchi_link=self, wpm_method=wpm_method,
+                                                               publish_delta=wpm_publish_delta))
         if enable_strokes:
-            self._strokes_meter = PloverStrokesMeter(stenogotchi_link=self, strokes_method=wpm_method, timeout=wpm_timeout)
+            self._meter_engine.add_meter('strokes', PloverStrokesMeter(stenogotchi_link=self, strokes_method=wpm_method,
+                                                                       publish_delta=strokes_publish_delta))
 
     def stop_wpm_meter(self, disable_wpm=True, disable_strokes=True):
+        if not self._meter_engine:
+            return
         if disable_wpm:
-            self._wpm_meter.quit()
-            self._wpm_meter = None
+            self._meter_engine.remove_meter('wpm')
         if disable_strokes:
-            self._strokes_meter.quit()
-            self._strokes_meter = None
+            self._meter_engine.remove_meter('strokes')
+        if not self._meter_engine.has_meters():
+            self._meter_engine.quit()
+            self._meter_engine = None
 
     def _on_wpm_meter_update_strokes(self, stats):
         """ Sends strokes stats to stenogotchi as a string """
@@ -143,15 +162,10 @@ class EngineServer():
             new: A list of the new actions for the current translation.
         """
         
-        # Send to WPM meter if we have one
-        if self._wpm_meter:
-            self._wpm_meter.on_translation(old, new)
-        # Send to Strokes meter if we have one
-        if self._strokes_meter:
-            self._strokes_meter.on_translation(old, new)
-
-        # print(self._wpm_meter.get_stats())
-        # print(self._strokes_meter.get_stats())
+        # Send to WPM and Strokes meters if we have any
+        meter_engine = self._meter_engine
+        if meter_engine:
+            meter_engine.on_translation(old, new)
 
     def _on_machine_state_changed(self, machine_type: str, machine_state: str):
         """Broadcasts when the active machine state changes.
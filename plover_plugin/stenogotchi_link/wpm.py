@@ -12,11 +12,19 @@
 ##    Spaces: A word is a whitespace-separated sequence of characters. This metric of course doesn’t take into account the fact that some words are longer than others, both in length and syllables.
 
 import time
-from threading import Timer
+from collections import deque
+from functools import lru_cache
+from threading import Timer, Lock
 from textstat.textstat import textstat
 
 from plover.formatting import OutputHelper
 
+# Output is grouped in buckets covering this many seconds
+BUCKET_SECONDS = 1
+# Number of distinct words whose syllable count is remembered
+SYLLABLE_CACHE_SIZE = 4096
+
+
 class RepeatTimer(Timer):
     """ 
     Perpetually repeating timer implementation of threading.Timer
@@ -26,16 +34,198 @@ class RepeatTimer(Timer):
         while not self.finished.wait(self.interval):
             self.function(*self.args, **self.kwargs)
 
+
+class Bucket(object):
+    """
+    Output characters and stroke actions recorded during one BUCKET_SECONDS interval
+    """
+    __slots__ = ('start', 'chars', 'actions', 'words', 'syllables')
+
+    def __init__(self, start):
+        self.start = start
+        self.chars = []
+        self.actions = 0
+        self.words = 0
+        self.syllables = 0
+
+    def totals(self):
+        return {
+            'chars': len(self.chars),
+            'words': self.words,
+            'syllables': self.syllables,
+            'actions': self.actions,
+        }
+
+
+class SlidingWindows(object):
+    """
+    Deque-based ring buffer of timestamped buckets, keeping running totals of
+    characters, words, syllables and actions for each named time window.
+    Recording output only touches the newest buckets and a tick only evicts
+    expired ones, so the cost doesn't grow with the length of the windows.
+    """
+
+    def __init__(self, timeouts, count_syllables=False):
+        self.count_syllables = count_syllables
+        self._lock = Lock()
+        self._buckets = deque()
+        self._timeouts = dict(timeouts)
+        # Number of newest buckets that fall inside each window
+        self._sizes = dict.fromkeys(self._timeouts, 0)
+        self._totals = {name: Bucket(0).totals() for name in self._timeouts}
+
+    def _current_bucket(self):
+        now = time.time()
+        start = now - now % BUCKET_SECONDS
+        if not self._buckets or self._buckets[-1].start < start:
+            self._buckets.append(Bucket(start))
+            for name in self._sizes:
+                self._sizes[name] += 1
+        return self._buckets[-1]
+
+    def _prev_char(self, k):
+        """ Returns the last character recorded before the k-th newest bucket """
+        for i in range(k + 1, len(self._buckets)):
+            chars = self._buckets[-1 - i].chars
+            if chars:
+                return chars[-1]
+        return None
+
+    def _apply(self, k, before, after):
+        """ Adds the change of the k-th newest bucket to every window containing it """
+        for name, size in self._sizes.items():
+            if k < size:
+                totals = self._totals[name]
+                for key in totals:
+                    totals[key] += after[key] - before[key]
+
+    def _next_chars(self, k):
+        """ Returns the characters recorded after the k-th newest bucket up to the next whitespace """
+        tail = []
+        for i in range(k - 1, -1, -1):
+            for c in self._buckets[-1 - i].chars:
+                if c.isspace():
+                    return ''.join(tail)
+                tail.append(c)
+        return ''.join(tail)
+
+    def _syllables_of(self, k):
+        """
+        Counts the syllables of the words starting in the k-th newest bucket, including the
+        part of its last word recorded in newer buckets
+        """
+        chars = self._buckets[-1 - k].chars
+        words = ''.join(chars).split()
+        if words and not chars[0].isspace():
+            prev_char = self._prev_char(k)
+            if prev_char is not None and not prev_char.isspace():
+                # Continues a word counted in an older bucket
+                words.pop(0)
+        if words and not chars[-1].isspace():
+            words[-1] += self._next_chars(k)
+        return _count_syllables(' '.join(words))
+
+    def _update_stats(self, k, before):
+        bucket = self._buckets[-1 - k]
+        text = ''.join(bucket.chars)
+        bucket.words = _count_word_starts(text, self._prev_char(k))
+        bucket.syllables = self._syllables_of(k) if self.count_syllables else 0
+        self._apply(k, before, bucket.totals())
+        if not self.count_syllables:
+            return
+        # A word is counted whole in the bucket it starts in, so update the buckets whose
+        # last word runs on into this one
+        for j in range(k + 1, len(self._buckets)):
+            older = self._buckets[-1 - j]
+            if not older.chars:
+                continue
+            if older.chars[-1].isspace():
+                break
+            before = older.totals()
+            older.syllables = self._syllables_of(j)
+            self._apply(j, before, older.totals())
+            if older.words:
+                break
+
+    def add_chars(self, text):
+        with self._lock:
+            bucket = self._current_bucket()
+            before = bucket.totals()
+            bucket.chars.extend(text)
+            self._update_stats(0, before)
+
+    def remove_chars(self, n):
+        with self._lock:
+            k = 0
+            while n > 0 and k < len(self._buckets):
+                bucket = self._buckets[-1 - k]
+                removed = min(n, len(bucket.chars))
+                if removed:
+                    before = bucket.totals()
+                    del bucket.chars[len(bucket.chars) - removed:]
+                    self._update_stats(k, before)
+                    n -= removed
+                k += 1
+
+    def add_actions(self, n):
+        with self._lock:
+            bucket = self._current_bucket()
+            before = bucket.totals()
+            bucket.actions += n
+            self._apply(0, before, bucket.totals())
+
+    def remove_actions(self, n):
+        with self._lock:
+            k = 0
+            while n > 0 and k < len(self._buckets):
+                bucket = self._buckets[-1 - k]
+                removed = min(n, bucket.actions)
+                if removed:
+                    before = bucket.totals()
+                    bucket.actions -= removed
+                    self._apply(k, before, bucket.totals())
+                    n -= removed
+                k += 1
+
+    def evict(self):
+        """ Drops buckets older than the window timeouts from the running totals """
+        current_time = time.time()
+        with self._lock:
+            for name, timeout in self._timeouts.items():
+                totals = self._totals[name]
+                while self._sizes[name]:
+                    bucket = self._buckets[-self._sizes[name]]
+                    if (current_time - bucket.start) <= timeout:
+                        break
+                    for key, value in bucket.totals().items():
+                        totals[key] -= value
+                    self._sizes[name] -= 1
+            max_size = max(self._sizes.values(), default=0)
+            while len(self._buckets) > max_size:
+                self._buckets.popleft()
+
+    def get(self, name):
+        """ Returns the totals of a window and the start time of its oldest output """
+        with self._lock:
+            start_time = None
+            size = self._sizes[name]
+            for i in range(len(self._buckets) - size, len(self._buckets)):
+                if self._buckets[i].chars:
+                    start_time = self._buckets[i].start
+                    break
+            return dict(self._totals[name]), start_time
+
+
 class CaptureOutput(object):
    
-    def __init__(self, chars):
-        self.chars = chars
+    def __init__(self, windows):
+        self.windows = windows
 
     def send_backspaces(self, n):
-        del self.chars[-n:]
+        self.windows.remove_chars(n)
 
     def send_string(self, s):
-        self.chars += _timestamp_items(s)
+        self.windows.add_chars(s)
 
     def send_key_combination(self, c):
         pass
@@ -44,68 +234,146 @@ class CaptureOutput(object):
         pass
 
 
-class BaseMeter():
-  
-    def __init__(self, timeout=60):
-        # Set timer to calculate wpm/strokes stats each second
+class PloverMeterEngine(object):
+    """
+    Renders each translation once into one shared set of sliding windows and
+    computes every registered meter on a single timer thread.
+    """
+    SHORT_WINDOW = 'short'
+    USER_WINDOW = 'user'
+
+    def __init__(self, timeout=60, publish='interval', publish_interval=10):
+        self.timeout = timeout
+        self.windows = SlidingWindows({
+            self.SHORT_WINDOW: 10,
+            self.USER_WINDOW: timeout,
+        })
+        self._meters = {}
+        self._ticks = 0
+        self._active = False
+        self.set_publishing(publish, publish_interval)
+        # Calculate stats each second and publish them as set by the publishing mode
         self._timer = RepeatTimer(1, self.on_timer)
         self._timer.start()
-        # Set timer to publish wpm/strokes stats each minute
-        self._event_timer = RepeatTimer(timeout, self.trigger_event_update)
-        self._event_timer.start()
-        self.chars = []
+
+    def set_publishing(self, publish='interval', publish_interval=10):
+        """
+        'interval' publishes all stats every timeout seconds. 'delta' checks
+        every publish_interval seconds and only publishes stats which changed
+        by at least the publish_delta of their meter while typing, plus a final
+        zero once typing has stopped and the window has emptied.
+        """
+        assert publish in ('interval', 'delta'), "bad publish mode: " + publish
+        self.publish = publish
+        self.publish_interval = max(1, int(publish_interval))
+
+    def add_meter(self, name, meter):
+        self._meters[name] = meter
+        self._update_syllable_counting()
+        meter.on_timer(self.windows)
+
+    def remove_meter(self, name):
+        self._meters.pop(name, None)
+        self._update_syllable_counting()
+
+    def has_meters(self):
+        return bool(self._meters)
+
+    def get_meters(self):
+        return dict(self._meters)
+
+    def _update_syllable_counting(self):
+        self.windows.count_syllables = any(meter.method == 'ncra' for meter in self._meters.values())
 
     def on_translation(self, old, new):
-        output = CaptureOutput(self.chars)
+        output = CaptureOutput(self.windows)
         output_helper = OutputHelper(output, False, False)
         output_helper.render(None, old, new)
+        if len(old) > 0:
+            self.windows.remove_actions(len(old))
+        self.windows.add_actions(len(new))
+        self._active = True
 
     def on_timer(self):
+        self.windows.evict()
+        self._ticks += 1
+        if self.publish == 'delta':
+            publish = self._ticks % self.publish_interval == 0
+        else:
+            publish = self._ticks % self.timeout == 0
+        if publish:
+            active = self._active
+            self._active = False
+        for meter in list(self._meters.values()):
+            meter.on_timer(self.windows)
+            if publish and (self.publish == 'interval' or meter.should_publish(active)):
+                meter.publish()
+
+    def quit(self):
+        self._timer.cancel()
+
+
+class BaseMeter():
+    """
+    A metric calculated by PloverMeterEngine from its shared windows
+    """
+    methods = ('ncra', 'traditional', 'spaces')
+
+    def __init__(self, stenogotchi_link, method='ncra', publish_delta=0):
+        self._stenogotchi_link = stenogotchi_link
+        self.publish_delta = publish_delta
+        self._published_value = None
+        self.set_method(method)
+
+    def set_method(self, method):
+        assert method in self.methods, "bad wpm method: " + method
+        self.method = method
+
+    def get_method(self):
+        return self.method
+
+    def get_value(self):
+        """ Returns the stat of the user window as a number """
+        raise NotImplementedError()
+
+    def should_publish(self, active):
+        value = self.get_value()
+        if active:
+            return self._published_value is None or abs(value - self._published_value) >= self.publish_delta
+        # Idle, only let the display know once that the window has emptied
+        return value == 0 and self._published_value not in (None, 0)
+
+    def publish(self):
+        self._published_value = self.get_value()
+        self.trigger_event_update()
+
+    def on_timer(self, windows):
         raise NotImplementedError()
 
     def trigger_event_update(self):
         raise NotImplementedError()
 
-    def quit(self):
-        self._timer.cancel()
-        self._event_timer.cancel()
 
 class PloverWpmMeter(BaseMeter):
 
-    def __init__(self, stenogotchi_link, wpm_method='ncra', timeout=60):
-        super().__init__(timeout)
-        self._stenogotchi_link = stenogotchi_link
-        self.strokes = []
-        self.wpm_methods = {
-            'ncra': False,          # NCRA (by syllables)
-            'traditional': False,   # Traditional (by characters)
-            'spaces': False,        # Spaces (by whitespace)
+    def __init__(self, stenogotchi_link, wpm_method='ncra', publish_delta=0):
+        self._windows = {
+            "wpm10": PloverMeterEngine.SHORT_WINDOW,
+            "wpm_user": PloverMeterEngine.USER_WINDOW,
         }
-        self._timeouts = {
-            "wpm10": 10,
-            "wpm_user": timeout,
-        }
-        self.set_wpm_method(wpm_method)
         self.wpm_stats = {}
-
-    def set_wpm_method(self, method):
-        self.wpm_methods = dict.fromkeys(self.wpm_methods, False)
-        self.wpm_methods[method] = True
-
-    def get_wpm_method(self):
-        for method, enabled in self.wpm_methods.items():
-            if enabled:
-                return method
+        super().__init__(stenogotchi_link, wpm_method, publish_delta)
 
     def get_stats(self):
         return self.wpm_stats
 
-    def on_timer(self):
-        max_timeout = max(self._timeouts.values())
-        self.chars = _filter_old_items(self.chars, max_timeout)
-        for name, timeout in self._timeouts.items():
-            chars = _filter_old_items(self.chars, timeout)
-            wpm = _wpm_of_chars(chars, method=self.get_wpm_method())
+    def get_value(self):
+        return int(self.wpm_stats['wpm_user'])
+
+    def on_timer(self, windows):
+        for name, window in self._windows.items():
+            totals, start_time = windows.get(window)
+            wpm = _wpm_of_totals(totals, start_time, method=self.method)
             self.wpm_stats[name] = str(wpm)
 
     def trigger_event_update(self):
@@ -114,113 +382,94 @@ class PloverWpmMeter(BaseMeter):
 
 class PloverStrokesMeter(BaseMeter):
 
-    def __init__(self, stenogotchi_link, strokes_method='ncra', timeout=60):
-        super().__init__(timeout)
-        self._stenogotchi_link = stenogotchi_link
-        self.actions = []
-        self.strokes_methods = {
-            'ncra': False,          # NCRA (by syllables)
-            'traditional': False,   # Traditional (by characters)
-            'spaces': False,        # Spaces (by whitespace)
-        }
-        self._timeouts = {
-            "strokes10": 10,
-            "strokes_user": timeout,
+    def __init__(self, stenogotchi_link, strokes_method='ncra', publish_delta=0):
+        self._windows = {
+            "strokes10": PloverMeterEngine.SHORT_WINDOW,
+            "strokes_user": PloverMeterEngine.USER_WINDOW,
         }
-        self.set_strokes_method(strokes_method)
         self.strokes_stats = {}
-       
-        # By default, the QLCDNumbers will just display "0", without a decimal
-        # point, on initial render. Render them ourselves so that we don't
-        # switch from "0" to "0.00" after a second.
-        self.on_timer()
-
-    def set_strokes_method(self, method):
-        self.strokes_methods = dict.fromkeys(self.strokes_methods, False)
-        self.strokes_methods[method] = True
-
-    def get_strokes_method(self):
-        for method, enabled in self.strokes_methods.items():
-            if enabled:
-                return method
+        super().__init__(stenogotchi_link, strokes_method, publish_delta)
 
     def get_stats(self):
         return self.strokes_stats
 
-    def on_translation(self, old, new):
-        super().on_translation(old, new)
-        if len(old) > 0:
-            self.actions = self.actions[:-len(old)]
-        self.actions += _timestamp_items(new)
+    def get_value(self):
+        return float(self.strokes_stats['strokes_user'])
 
-    def on_timer(self):
-        max_timeout = max(self._timeouts.values())
-        self.chars = _filter_old_items(self.chars, max_timeout)
-        self.actions = _filter_old_items(self.actions, max_timeout)
-        for name, timeout in self._timeouts.items():
-            chars = _filter_old_items(self.chars, timeout)
-            num_strokes = len(_filter_old_items(self.actions, timeout))
-            strokes_per_word = _spw_of_chars(
-                num_strokes,
-                chars,
-                method=self.get_strokes_method()
+    def on_timer(self, windows):
+        for name, window in self._windows.items():
+            totals, _ = windows.get(window)
+            strokes_per_word = _spw_of_totals(
+                totals['actions'],
+                totals,
+                method=self.method
             )
             self.strokes_stats[name] = str("{:0.2f}".format(strokes_per_word))
 
     def trigger_event_update(self):
         self._stenogotchi_link._on_wpm_meter_update_strokes(stats=self.strokes_stats)
 
-def _timestamp_items(items):
-    current_time = time.time()
-    return [(i, current_time) for i in items]
 
+def _count_word_starts(text, prev_char=None):
+    """ Counts the whitespace-separated words starting in text, given the character preceding it """
+    count = 0
+    prev_space = prev_char is None or prev_char.isspace()
+    for c in text:
+        space = c.isspace()
+        if prev_space and not space:
+            count += 1
+        prev_space = space
+    return count
 
-def _filter_old_items(items, timeout):
-    current_time = time.time()
-    return [(i, t) for i, t in items
-            if (current_time - t) <= timeout]
+
+@lru_cache(maxsize=SYLLABLE_CACHE_SIZE)
+def _syllables_in_word(word):
+    return textstat.syllable_count(word)
 
 
-def _words_in_chars(chars, method):
-    text = "".join(c for c, _ in chars)
+def _count_syllables(text):
+    """ Sums the cached per-word syllable counts of text """
+    return sum(_syllables_in_word(word) for word in text.lower().split())
+
+
+def _words_in_totals(totals, method):
     if method == "ncra":
         # The NCRA defines a "word" to be 1.4 syllables, which is the average
         # number of syllables per English word.
         syllables_per_word = 1.4
         # For some reason, textstat returns syllable counts such as a
         # one-syllable word like "the" being 0.9 syllables.
-        syllables_in_text = textstat.syllable_count(text) / 0.9
+        syllables_in_text = totals['syllables'] / 0.9
         return syllables_in_text * (1 / syllables_per_word)
     elif method == "traditional":
         # Formal definition; see https://en.wikipedia.org/wiki/Words_per_minute
-        return len(text) / 5
+        return totals['chars'] / 5
     elif method == "spaces":
-        return len([i for i in text.split() if i])
+        return totals['words']
     else:
         assert False, "bad wpm method: " + method
 
 
-def _time_interval_of_chars(chars):
-    start_time = min(t for _, t in chars)
+def _time_interval_since(start_time):
     current_time = time.time()
     time_interval = current_time - start_time
     time_interval = max(1, time_interval)
     return time_interval
 
 
-def _wpm_of_chars(chars, method):
-    num_words = _words_in_chars(chars, method)
-    if not num_words:
+def _wpm_of_totals(totals, start_time, method):
+    num_words = _words_in_totals(totals, method)
+    if not num_words or start_time is None:
         return 0
 
-    time_interval = _time_interval_of_chars(chars)
+    time_interval = _time_interval_since(start_time)
     num_minutes = time_interval / 60
     num_words_per_minute = num_words / num_minutes
     return int(round(num_words_per_minute))
 
 
-def _spw_of_chars(num_strokes, chars, method):
-    num_words = _words_in_chars(chars, method)
+def _spw_of_totals(num_strokes, totals, method):
+    num_words = _words_in_totals(totals, method)
     if not num_words:
         return 0
 
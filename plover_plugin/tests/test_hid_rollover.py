@@ -0,0 +1,238 @@
+"""
+Round-trip tests of the HID reports produced by BTClient.
+
+Plover, D-Bus, GLib and Xlib are replaced by minimal stand-ins so the tests run without a
+Plover install or a bus. Reports are decoded back into text the way a host would see them:
+a key produces a character when it shows up in a report it was not in before, shifted if
+the report holds the shift modifier.
+
+Run with `python -m pytest plover_plugin/tests` or `python plover_plugin/tests/test_hid_rollover.py`.
+"""
+import os
+import sys
+import types
+import random
+import string
+import unittest
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stenogotchi_link.keymap import plover_keytable
+
+HID_REPORT_LENGTH = 10
+SHIFT_MASK = 1           # X.ShiftMask, which plover_modkey maps to left shift
+LEFT_SHIFT_BIT = 1 << (7 - 6)
+
+# US layout: HID usage id -> (unshifted, shifted) character
+US_LAYOUT = {}
+for i, c in enumerate(string.ascii_lowercase):
+    US_LAYOUT[4 + i] = (c, c.upper())
+for i, (c, s) in enumerate(zip('1234567890', '!@#$%^&*()')):
+    US_LAYOUT[30 + i] = (c, s)
+US_LAYOUT.update({
+    40: ('\n', '\n'), 43: ('\t', '\t'), 44: (' ', ' '), 45: ('-', '_'), 46: ('=', '+'), 47: ('[', '{'),
+    48: (']', '}'), 49: ('\\', '|'), 51: (';', ':'), 52: ("'", '"'), 53: ('`', '~'), 54: (',', '<'),
+    55: ('.', '>'), 56: ('/', '?'),
+})
+BACKSPACE_HID = 42
+
+HID_TO_KEYCODE = {hid: keycode for keycode, hid in sorted(plover_keytable.items(), reverse=True)}
+# characters the stub keymap can type
+TYPEABLE = ''.join(c for hid, chars in US_LAYOUT.items() if hid in HID_TO_KEYCODE for c in dict.fromkeys(chars))
+KEYSTRINGS = {'Control_L': 37, 'Alt_L': 64, 'Shift_L': 50, 'Super_L': 133, 'Tab': 23,
+              'BackSpace': 22, 'c': 54, 'v': 55, 'a': 38}
+
+
+def _install_stubs():
+    """ Registers the modules clients.py imports with just enough behaviour for BTClient """
+    Mapping = namedtuple('Mapping', 'keycode modifiers keysym custom_mapping')
+
+    char_mappings = {}
+    for hid, (plain, shifted) in US_LAYOUT.items():
+        keycode = HID_TO_KEYCODE.get(hid)
+        if keycode is None:
+            continue
+        char_mappings.setdefault(shifted, Mapping(keycode, SHIFT_MASK, ord(shifted), None))
+        char_mappings[plain] = Mapping(keycode, 0, ord(plain), None)
+
+    class KeyboardEmulation:
+        keymap_version = 0
+
+        def __init__(self):
+            self._backspace_mapping = Mapping(HID_TO_KEYCODE[BACKSPACE_HID], 0, 0, None)
+
+        def _get_mapping(self, keysym):
+            return char_mappings.get(chr(keysym))
+
+        def _get_keycode_from_keystring(self, keystring):
+            return KEYSTRINGS.get(keystring)
+
+    def parse_key_combo(combo_string, key_name_to_key_code):
+        """ Subset of plover.key_combo.parse_key_combo: names, spaces and nested parentheses """
+        events, held, name = [], [], ''
+        for char in combo_string + ' ':
+            if char in ' ()':
+                if name:
+                    keycode = key_name_to_key_code(name)
+                    events.append((keycode, True))
+                    if char == '(':
+                        held.append(keycode)
+                    else:
+                        events.append((keycode, False))
+                    name = ''
+                if char == ')':
+                    events.append((held.pop(), False))
+            else:
+                name += char
+        return events
+
+    class Interface:
+        def __init__(self, obj, name):
+            self.sent = []
+
+        def send_keys_buffer(self, buf):
+            self.sent.append(bytes(buf))
+
+    class DBusException(Exception):
+        pass
+
+    modules = {
+        'plover': types.ModuleType('plover'),
+        'plover.log': types.ModuleType('plover.log'),
+        'plover.oslayer': types.ModuleType('plover.oslayer'),
+        'plover.oslayer.xkeyboardcontrol': types.ModuleType('plover.oslayer.xkeyboardcontrol'),
+        'plover.key_combo': types.ModuleType('plover.key_combo'),
+        'dbus': types.ModuleType('dbus'),
+        'dbus.exceptions': types.ModuleType('dbus.exceptions'),
+        'dbus.mainloop': types.ModuleType('dbus.mainloop'),
+        'dbus.mainloop.glib': types.ModuleType('dbus.mainloop.glib'),
+        'gi': types.ModuleType('gi'),
+        'gi.repository': types.ModuleType('gi.repository'),
+        'Xlib': types.ModuleType('Xlib'),
+    }
+    for level in ('debug', 'info', 'warning', 'error'):
+        setattr(modules['plover.log'], level, lambda *args, **kwargs: None)
+    modules['plover'].log = modules['plover.log']
+    modules['plover'].key_combo = modules['plover.key_combo']
+    modules['plover.key_combo'].parse_key_combo = parse_key_combo
+    modules['plover.oslayer.xkeyboardcontrol'].KeyboardEmulation = KeyboardEmulation
+    modules['plover.oslayer.xkeyboardcontrol'].uchr_to_keysym = ord
+    modules['dbus'].SystemBus = lambda: types.SimpleNamespace(get_object=lambda *args: None)
+    modules['dbus'].Interface = Interface
+    modules['dbus'].ByteArray = bytes
+    modules['dbus'].exceptions = modules['dbus.exceptions']
+    modules['dbus.exceptions'].DBusException = DBusException
+    modules['dbus.mainloop.glib'].DBusGMainLoop = lambda **kwargs: None
+    modules['gi.repository'].GLib = types.SimpleNamespace(MainLoop=lambda: None)
+    modules['Xlib'].X = types.SimpleNamespace(NoSymbol=0, ShiftMask=1, Mod5Mask=128)
+    modules['Xlib'].XK = types.SimpleNamespace(string_to_keysym=lambda s: 0)
+    for name, module in modules.items():
+        sys.modules.setdefault(name, module)
+
+
+_install_stubs()
+from stenogotchi_link.clients import BTClient, HID_ROLLOVER
+
+
+def split_reports(buf):
+    assert len(buf) % HID_REPORT_LENGTH == 0, f"buffer of {len(buf)} bytes"
+    return [buf[i:i + HID_REPORT_LENGTH] for i in range(0, len(buf), HID_REPORT_LENGTH)]
+
+
+def decode(reports):
+    """ Returns the text a host types when receiving reports """
+    text = []
+    held = set()
+    for report in reports:
+        assert len(report) == HID_REPORT_LENGTH and report[:2] == b'\xa1\x01' and report[3] == 0
+        keys = [k for k in report[4:] if k]
+        assert len(keys) <= HID_ROLLOVER
+        shifted = bool(report[2] & LEFT_SHIFT_BIT)
+        for key in keys:
+            if key not in held:
+                text.append('\b' if key == BACKSPACE_HID else US_LAYOUT[key][shifted])
+        held = set(keys)
+    assert not held, "keys left pressed at the end of the stream"
+    return ''.join(text)
+
+
+def _sent_reports(client):
+    reports = []
+    for buf in client.btk_service.sent:
+        reports.extend(split_reports(buf))
+    client.btk_service.sent.clear()
+    return reports
+
+
+class TestRollover(unittest.TestCase):
+    ALPHABET = TYPEABLE
+
+    def setUp(self):
+        self.client = BTClient()
+
+    def roundtrip(self, text, rollover=True):
+        self.client.rollover = rollover
+        self.client.send_string(text)
+        reports = _sent_reports(self.client)
+        self.assertEqual(decode(reports), text)
+        return reports
+
+    def test_rollover_matches_plain_encoding(self):
+        for text in ('hello world', 'Hello World', 'aAaA', 'x', ''):
+            self.assertEqual(decode(self.client.encode_string(text)), text)
+            self.client.rollover = False
+            self.assertEqual(decode(self.client.encode_string(text)), text)
+            self.client.rollover = True
+
+    def test_repeated_characters(self):
+        self.roundtrip('aa')
+        self.roundtrip('bookkeeper  balloon')
+        self.roundtrip('aaaaaaa')
+
+    def test_modifier_changes(self):
+        self.roundtrip('aBcDeF')
+        self.roundtrip('Hello, World! 1+1=2?')
+        self.roundtrip('ABCdefGHI')
+
+    def test_runs_longer_than_rollover(self):
+        text = 'abcdefghijklmnopqrstuvwxyz'
+        reports = self.roundtrip(text)
+        # runs of HID_ROLLOVER keys take one report per key plus one release
+        runs = -(-len(text) // HID_ROLLOVER)
+        self.assertEqual(len(reports), len(text) + runs)
+        self.roundtrip('ABCDEFGHIJKLM')
+
+    def test_random_strings(self):
+        rng = random.Random(0)
+        for _ in range(3000):
+            text = ''.join(rng.choice(self.ALPHABET) for _ in range(rng.randint(1, 40)))
+            self.roundtrip(text)
+            self.roundtrip(text, rollover=False)
+
+    def test_backspaces(self):
+        self.client.send_backspaces(3)
+        self.assertEqual(decode(_sent_reports(self.client)), '\b\b\b')
+
+
+class TestKeyCombination(unittest.TestCase):
+    def setUp(self):
+        self.client = BTClient()
+
+    def test_reports_have_full_length(self):
+        for combo in ('Control_L(c)', 'Alt_L(Tab)', 'Super_L', 'Control_L(Shift_L(v))', 'a'):
+            self.client.send_key_combination(combo)
+            reports = _sent_reports(self.client)
+            self.assertTrue(reports, combo)
+            self.assertTrue(all(len(report) == HID_REPORT_LENGTH for report in reports), combo)
+
+    def test_modifier_held_around_key(self):
+        self.client.send_key_combination('Control_L(c)')
+        reports = _sent_reports(self.client)
+        left_ctrl = 1 << (7 - 7)
+        self.assertEqual([(r[2], r[4]) for r in reports],
+                         [(left_ctrl, 0), (left_ctrl, 6), (left_ctrl, 0), (0, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Compares the precompiled HID report tables of BTClient with the per-character path they
+replaced, which looked up the keymap and built the reports of every character as it was sent.
+Both must produce the same reports, and the benchmark prints the characters per second each
+encodes with the D-Bus call left out.
+
+Uses the stand-ins of test_hid_rollover, whose keymap lookups are cheaper than Plover's Xlib
+backed ones, so the reference speed is an upper bound.
+
+Run with `python -m pytest plover_plugin/tests` or `python plover_plugin/tests/test_send_string_bench.py`,
+which also prints the benchmark.
+"""
+import os
+import sys
+import time
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_hid_rollover import BTClient, TYPEABLE, decode
+from stenogotchi_link.clients import uchr_to_keysym
+
+
+def reference_encode_string(client, s):
+    """ The per-character send_string BTClient shipped with, returning the reports instead of sending them """
+    state_list = []
+    for char in s:
+        keysym = uchr_to_keysym(char)
+        mapping = client.ke._get_mapping(keysym)
+        if mapping is None:
+            continue
+        sublist = client.map_hid_events(mapping.keycode, mapping.modifiers)
+        if sublist:
+            state_list.extend(sublist)
+    return [bytes(state) for state in state_list]
+
+
+def sample_text(rng, length=1200):
+    words = [''.join(rng.choice(TYPEABLE) for _ in range(rng.randint(1, 9))) for _ in range(200)]
+    text = ''
+    while len(text) < length:
+        text += rng.choice(words) + ' '
+    return text[:length]
+
+
+def benchmark(rounds=20):
+    """
+    Prints the characters per second each path encodes and returns them as {name: chars/s}.
+    """
+    client = BTClient()
+    text = sample_text(random.Random(0))
+
+    def precompiled(s, rollover):
+        client.rollover = rollover
+        return client.encode_string(s)
+
+    paths = (
+        ('reference', lambda s: reference_encode_string(client, s), max(1, rounds // 10)),
+        ('precompiled', lambda s: precompiled(s, False), rounds),
+        ('rollover', lambda s: precompiled(s, True), rounds),
+    )
+    rates = {}
+    for name, encode, count in paths:
+        started = time.perf_counter()
+        for _ in range(count):
+            encode(text)
+        took = time.perf_counter() - started
+        rates[name] = len(text) * count / took
+        print("%-11s %10.0f chars/s" % (name, rates[name]))
+    return rates
+
+
+class TestPrecompiledReports(unittest.TestCase):
+    def setUp(self):
+        self.client = BTClient()
+        self.client.rollover = False
+
+    def test_same_reports_as_reference(self):
+        rng = random.Random(0)
+        texts = [TYPEABLE, sample_text(rng)]
+        texts += [''.join(rng.choice(TYPEABLE) for _ in range(rng.randint(1, 40))) for _ in range(500)]
+        for text in texts:
+            reports = reference_encode_string(self.client, text)
+            self.assertEqual(self.client.encode_string(text), reports, text)
+            self.assertEqual(decode(reports), text)
+
+    def test_unmapped_characters_are_skipped(self):
+        self.assertEqual(self.client.encode_string('a☃b'), reference_encode_string(self.client, 'ab'))
+
+    def test_faster_than_reference(self):
+        rates = benchmark(rounds=10)
+        self.assertGreater(rates['precompiled'], rates['reference'])
+
+
+if __name__ == '__main__':
+    benchmark()
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Checks that the running totals SlidingWindows keeps as output is added and removed match the
+stats computed over the full text, and measures the cost of a meter tick against recounting the
+syllables of the whole window each second, as the meter did before.
+
+Plover is replaced by a minimal stand-in, and textstat too when it can't count syllables here.
+
+Run with `python -m pytest plover_plugin/tests` or `python plover_plugin/tests/test_wpm.py`, which
+also prints the benchmark.
+"""
+import os
+import re
+import sys
+import time
+import types
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def _install_stubs():
+    """ Registers the modules wpm.py imports that may be missing """
+    formatting = types.ModuleType('plover.formatting')
+    formatting.OutputHelper = object
+    plover = types.ModuleType('plover')
+    plover.formatting = formatting
+    sys.modules.setdefault('plover', plover)
+    sys.modules.setdefault('plover.formatting', formatting)
+    try:
+        from textstat.textstat import textstat
+        textstat.syllable_count('plover')
+    except Exception:
+        # not installed, or its syllable data can't be downloaded
+        module = types.ModuleType('textstat.textstat')
+        # one syllable per group of vowels, enough to tell words apart
+        module.textstat = types.SimpleNamespace(
+            syllable_count=lambda text: sum(max(1, len(re.findall('[aeiouy]+', word))) for word in text.split()))
+        sys.modules['textstat'] = types.ModuleType('textstat')
+        sys.modules['textstat.textstat'] = module
+
+
+_install_stubs()
+from stenogotchi_link import wpm
+
+WORDS = ('the', 'of', 'and', 'stenography', 'keyboard', 'plover', 'chord', 'translation', 'dictionary',
+         'a', 'is', 'international', 'court', 'reporter', 'accuracy', 'realtime', 'it', 'syllable')
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def stroke_stream(rng, strokes):
+    """
+    Yields ('add', text) and ('remove', n) edits like the ones Plover translations produce,
+    with the seconds elapsed before each. Words are often split across strokes, and so across buckets.
+    """
+    for _ in range(strokes):
+        delay = rng.choice((0.05, 0.2, 0.4, 0.9, 1.3))
+        if rng.random() < 0.15:
+            yield delay, 'remove', rng.randint(1, 6)
+        else:
+            word = rng.choice(WORDS)
+            if rng.random() < 0.4:
+                cut = rng.randint(1, len(word))
+                yield delay, 'add', word[:cut]
+                yield rng.choice((0.3, 1.1, 2.5)), 'add', word[cut:] + ' '
+            else:
+                yield delay, 'add', (' ' if rng.random() < 0.3 else '') + word + rng.choice(('', ' ', ' ', '  '))
+
+
+def full_stats(text):
+    return {
+        'chars': len(text),
+        'words': len(text.split()),
+        'syllables': wpm._count_syllables(text),
+    }
+
+
+class TestSlidingWindows(unittest.TestCase):
+    def setUp(self):
+        self._time = wpm.time.time
+        self.clock = wpm.time.time = FakeClock()
+
+    def tearDown(self):
+        wpm.time.time = self._time
+
+    def replay(self, rng, windows, strokes):
+        text = ''
+        for delay, action, arg in stroke_stream(rng, strokes):
+            self.clock.now += delay
+            if action == 'add':
+                windows.add_chars(arg)
+                text += arg
+            else:
+                windows.remove_chars(arg)
+                text = text[:max(0, len(text) - arg)]
+            windows.evict()
+        return text
+
+    def test_totals_match_full_recompute(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            windows = wpm.SlidingWindows({'short': 10 ** 6, 'user': 10 ** 7}, count_syllables=True)
+            text = self.replay(rng, windows, rng.randint(1, 150))
+            expected = full_stats(text)
+            for name in ('short', 'user'):
+                totals, _ = windows.get(name)
+                self.assertEqual({key: totals[key] for key in expected}, expected, text)
+
+    def test_word_split_across_buckets(self):
+        windows = wpm.SlidingWindows({'user': 60}, count_syllables=True)
+        for delay, part in ((0, 'ch'), (1, 'ord'), (1, ' international'), (2, 'ly ')):
+            self.clock.now += delay
+            windows.add_chars(part)
+        totals, _ = windows.get('user')
+        self.assertEqual(totals['syllables'], wpm._count_syllables('chord internationally'))
+        self.assertEqual(totals['words'], 2)
+
+        windows.remove_chars(len('ly '))
+        totals, _ = windows.get('user')
+        self.assertEqual(totals['syllables'], wpm._count_syllables('chord international'))
+
+    def test_expired_buckets_leave_the_window(self):
+        windows = wpm.SlidingWindows({'short': 10}, count_syllables=True)
+        windows.add_chars('keyboard ')
+        self.clock.now += 30
+        windows.add_chars('plover ')
+        windows.evict()
+        totals, _ = windows.get('short')
+        self.assertEqual({key: totals[key] for key in ('chars', 'words', 'syllables')}, full_stats('plover '))
+
+
+def benchmark(words=3000, wpm_rate=150, window=60):
+    """
+    Types words at wpm_rate with one meter tick per second, and prints the time ticks take when
+    recounting the syllables of the whole window with textstat, as before, and with the running
+    totals of SlidingWindows. Returns {name: microseconds per tick}.
+    """
+    from textstat.textstat import textstat
+
+    rng = random.Random(0)
+    seconds_per_word = 60 / wpm_rate
+    typed = [(i * seconds_per_word, rng.choice(WORDS) + ' ') for i in range(words)]
+    ticks = int(typed[-1][0]) + 1
+
+    # before: the text of the window is kept and counted as a whole every tick
+    started = time.perf_counter()
+    recent = []
+    position = 0
+    for tick in range(ticks):
+        while position < len(typed) and typed[position][0] <= tick:
+            recent.append(typed[position])
+            position += 1
+        recent = [(at, word) for at, word in recent if tick - at <= window]
+        textstat.syllable_count(''.join(word for _, word in recent))
+    before = (time.perf_counter() - started) / ticks
+
+    # after: words are counted as they are added, a tick only evicts expired buckets
+    wpm._syllables_in_word.cache_clear()
+    clock, wpm.time.time = wpm.time.time, FakeClock(0.0)
+    try:
+        windows = wpm.SlidingWindows({'short': 10, 'user': window}, count_syllables=True)
+        started = time.perf_counter()
+        position = 0
+        for tick in range(ticks):
+            while position < len(typed) and typed[position][0] <= tick:
+                wpm.time.time.now = typed[position][0]
+                windows.add_chars(typed[position][1])
+                position += 1
+            wpm.time.time.now = tick
+            windows.evict()
+            windows.get('user')
+        after = (time.perf_counter() - started) / ticks
+    finally:
+        wpm.time.time = clock
+
+    results = {'recount': before * 10 ** 6, 'sliding windows': after * 10 ** 6}
+    for name, took in results.items():
+        print("%-15s %8.1f us/tick over %d ticks" % (name, took, ticks))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
+    unittest.main()
@@ -1,10 +1,22 @@
 #!/usr/bin/python3
+import sys
+
+# started ahead of all other imports so --bench-startup can time them too
+if any(arg.startswith('--bench-startup') for arg in sys.argv[1:]):
+    from stenogotchi.bench import StartupBench
+    bench = StartupBench()
+else:
+    bench = None
+
+import os
 import logging
 import argparse
+import atexit
 import time
 import signal
-import sys
 import toml
+import json
+import threading
 
 import stenogotchi
 from stenogotchi import utils
@@ -73,7 +85,19 @@ if __name__ == '__main__':
     parser.add_argument('--print-config', dest="print_config", action="store_true", default=False,
                         help="Print the configuration.")
 
+    parser.add_argument('--profile-plugins', dest="profile_plugins", action="store_true", default=False,
+                        help="Print timings of plugin callbacks at exit.")
+
+    parser.add_argument('--print-config-timing', dest="print_config_timing", action="store_true", default=False,
+                        help="Print how long loading the configuration takes with and without the cache and exit.")
+
+    parser.add_argument('--bench-startup', dest="bench_startup", action="store", nargs='?', default=None,
+                        const='/var/tmp/stenogotchi/startup-bench.json', metavar='REPORT',
+                        help="Time each startup phase and module import, write a JSON report (by default to %(const)s) and exit.")
+
     args = parser.parse_args()
+    mark = bench.mark if bench else lambda phase: None
+    mark('imports')
 
 
     if plugins_cmd.used_plugin_cmd(args):
@@ -86,7 +110,17 @@ if __name__ == '__main__':
         print(stenogotchi.__version__)
         sys.exit(0)
 
+    if args.print_config_timing:
+        for use_cache in (False, True):
+            timings = []
+            utils.load_config(args, timings=timings, use_cache=use_cache)
+            print("%s cache: %.2fms" % ('with' if use_cache else 'without', sum(ms for _, ms in timings)))
+            for step, ms in timings:
+                print("  %8.2fms  %s" % (ms, step))
+        sys.exit(0)
+
     config = utils.load_config(args)
+    mark('load_config')
 
     if args.print_config:
         print(toml.dumps(config, encoder=DottedTomlEncoder()))
@@ -97,22 +131,67 @@ if __name__ == '__main__':
     from stenogotchi.ui.display import Display
     from stenogotchi import plugins
 
+    mark('main_imports')
+
     stenogotchi.config = config
     fs.setup_mounts(config)
+    mark('setup_mounts')
     log.setup_logging(args, config)
+    mark('setup_logging')
     fonts.init(config)
+    mark('fonts_init')
 
     stenogotchi.set_name(config['main']['name'])
+    mark('set_name')
+
+    if args.profile_plugins:
+        def dump_plugin_profile():
+            report = plugins.profile_report()
+            logging.info("plugin callback timings:\n%s" % report)
+            print(report)
+
+        atexit.register(dump_plugin_profile)
+        # exit through sys.exit on SIGTERM so the report is written when stopped as a service
+        signal.signal(signal.SIGTERM, lambda *unused: sys.exit(0))
 
     plugins.load(config)
+    mark('plugins_load')
 
     display = Display(config=config, state={'name': '%s>' % stenogotchi.name()})
+    mark('display_init')
 
     if args.do_clear:
         do_clear(display)
         sys.exit(0)
 
     agent = Agent(view=display, config=config)
+    mark('agent_init')
+
+    if bench:
+        rendered = threading.Event()
+        display.on_render(lambda canvas: rendered.set())
+        agent.start()
+        rendered.wait(60)
+        mark('first_frame')
+        # the first face is up once the display thread has pushed (or skipped) its first frame
+        while config['ui']['display']['enabled'] and time.perf_counter() - bench.started < 120:
+            stats = display.render_stats()
+            if stats['frames_rendered'] + stats['frames_skipped'] > 0:
+                break
+            time.sleep(0.01)
+        mark('first_face')
+        for name in list(plugins.loading):
+            plugins.ensure_loaded(name, timeout=60)
+        mark('background_plugins')
+
+        bench.extra['plugins'] = plugins.boot_timings
+        bench.extra['display'] = display.render_stats()
+        bench.save(args.bench_startup)
+        logging.info("startup benchmark written to %s" % args.bench_startup)
+        print(json.dumps({'wall_ms': bench.report()['wall_ms'], 'phases': bench.phases}, indent=2))
+        # plugin threads started by the ready event may not be daemons
+        logging.shutdown()
+        os._exit(0)
 
     def usr1_handler(*unused):
         logging.info('Received USR1 singal. Restart process ...')
@@ -153,6 +153,9 @@ def shutdown():
 
     logging.warning("syncing...")
 
+    from stenogotchi.utils import flush_config
+    flush_config()
+
     from stenogotchi import fs
     for m in fs.mounts:
         m.sync()
@@ -192,6 +195,9 @@ def reboot(mode=None):
 
     logging.warning("syncing...")
 
+    from stenogotchi.utils import flush_config
+    flush_config()
+
     from stenogotchi import fs
     for m in fs.mounts:
         m.sync()
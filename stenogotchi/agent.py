@@ -30,7 +30,7 @@ class Agent(Automata):
         self.mode = 'auto'
 
         logging.info("%s (v%s)", stenogotchi.name(), stenogotchi.__version__)
-        for _, plugin in plugins.loaded.items():
+        for _, plugin in list(plugins.loaded.items()):
             logging.debug("plugin '%s' v%s", plugin.__class__.__name__, plugin.__version__)
 
     def config(self):
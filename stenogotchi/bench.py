@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import importlib.abc
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    Wraps the loader of a module to time its execution, everything else is passed through.
+    """
+
+    def __init__(self, loader, name, timer):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # a module's own code runs on the loader it was found with
+        module.__loader__ = self._loader
+        self._timer.enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer.leave(self._name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Records how long every module imported while installed took to execute, both including and
+    excluding the modules it imported in turn, and the thread it was imported on.
+    """
+
+    def __init__(self):
+        self.imports = []
+        self._local = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def enter(self):
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        stack = self._stack()
+        started, children = stack.pop()
+        took = time.perf_counter() - started
+        if stack:
+            stack[-1][1] += took
+        self.imports.append({
+            'module': name,
+            'phase': None,
+            'thread': threading.current_thread().name,
+            'total_ms': round(took * 1000, 2),
+            'self_ms': round((took - children) * 1000, 2),
+        })
+
+
+class StartupBench:
+    """
+    Times the startup sequence, split into phases at each call to mark(), in wall clock and
+    CPU time along with the modules imported during each phase, and writes them out as a JSON report.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self._last = (self.started, self.started_cpu)
+        self.phases = []
+        self.extra = {}
+        self.imports = ImportTimer()
+        self.imports.install()
+
+    def mark(self, phase):
+        """
+        Ends the current phase, which began at the previous mark, under the given name.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.phases.append({
+            'phase': phase,
+            'wall_ms': round((wall - self._last[0]) * 1000, 1),
+            'cpu_ms': round((cpu - self._last[1]) * 1000, 1),
+            'since_start_ms': round((wall - self.started) * 1000, 1),
+        })
+        for record in self.imports.imports:
+            if record['phase'] is None:
+                record['phase'] = phase
+        self._last = (time.perf_counter(), time.process_time())
+
+    def report(self):
+        return {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'wall_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'cpu_ms': round((time.process_time() - self.started_cpu) * 1000, 1),
+            'phases': self.phases,
+            'imports': sorted(self.imports.imports, key=lambda i: i['total_ms'], reverse=True),
+            **self.extra,
+        }
+
+    def save(self, path):
+        self.imports.uninstall()
+        report = self.report()
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        return report
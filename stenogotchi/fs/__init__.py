@@ -17,12 +17,20 @@ def ensure_write(filename, mode='w'):
     path = os.path.dirname(filename)
     fd, tmp = tempfile.mkstemp(dir=path)
 
-    with os.fdopen(fd, mode) as f:
-        yield f
-        f.flush()
-        os.fsync(f.fileno())
-
-    os.replace(tmp, filename)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+        # keep the permissions of the file being replaced rather than the private ones of mkstemp
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 
 def size_of(path):
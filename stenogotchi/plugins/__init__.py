@@ -1,9 +1,13 @@
 import os
+import ast
 import glob
-import _thread
+import time
+import heapq
+import itertools
 import threading
 import importlib, importlib.util
 import logging
+from collections import deque
 
 
 
@@ -12,6 +16,159 @@ loaded = {}
 database = {}
 locks = {}
 
+# events which jump ahead of queued ui updates and mood changes
+PRIORITY_EVENTS = {'plover_boot', 'plover_ready', 'plover_quit', 'bt_connected', 'bt_disconnected',
+                   'dict_lookup_done'}
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+# seconds an idle worker waits for new callbacks before exiting
+WORKER_IDLE_TIMEOUT = 30.0
+# number of recent durations kept per callback to compute percentiles from
+PROFILE_SAMPLES = 200
+# callbacks running longer than this many seconds are logged
+SLOW_CALLBACK_TIME = 1.0
+
+profile = {}
+profile_lock = threading.Lock()
+
+# events describing the plugin setup, replayed to plugins which finish loading after they fired
+LIFECYCLE_EVENTS = ('loaded', 'config_changed', 'display_setup', 'ui_setup', 'ready')
+# plugins handling any of these are imported before the UI is set up, the others in the background
+UI_EVENTS = {'ui_setup', 'ui_update', 'display_setup'}
+# events kept for a plugin while it is being imported, the oldest are dropped first
+MAX_BUFFERED_EVENTS = 32
+
+# name -> {'events', 'lazy'} read from the plugin source without importing it
+metadata = {}
+# enabled lazy plugins not imported yet, name -> filename
+deferred = {}
+# plugins being imported, name -> threading.Event set once done
+loading = {}
+# name -> {'mode', 'import_ms', 'loaded_ms'}
+boot_timings = {}
+_lifecycle = {}
+_buffered = {}
+_load_lock = threading.RLock()
+
+
+class Dispatcher:
+    """
+    Runs plugin callbacks on a bounded pool of worker threads. Calls to the same plugin::callback
+    are queued and run one at a time in the order they were made, while different callbacks run in
+    parallel. Workers are started on demand up to max_workers and exit again when idle. Some
+    callbacks never return (e.g. main loops started from on_ready), so the pool should leave room
+    for those.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max(1, int(max_workers))
+        self._cond = threading.Condition()
+        # (priority, sequence, lock_name) of callbacks with queued calls and none running
+        self._ready = []
+        self._seq = itertools.count()
+        # lock_name -> deque of (priority, submitted, callback, args, kwargs)
+        self._queues = {}
+        self._scheduled = set()
+        self._workers = 0
+        self._idle = 0
+        self._stats = {}
+        self._saturated = False
+
+    def submit(self, plugin_name, lock_name, callback, args=(), kwargs=None, priority=PRIORITY_NORMAL):
+        with self._cond:
+            queue = self._queues.setdefault(lock_name, deque())
+            queue.append((priority, time.monotonic(), callback, args, kwargs or {}))
+            stats = self._plugin_stats(plugin_name)
+            stats['queued'] += 1
+            stats['max_queued'] = max(stats['max_queued'], stats['queued'])
+
+            if lock_name not in self._scheduled:
+                self._scheduled.add(lock_name)
+                heapq.heappush(self._ready, (priority, next(self._seq), lock_name))
+
+            if self._idle < len(self._ready):
+                if self._workers < self.max_workers:
+                    self._workers += 1
+                    threading.Thread(target=self._worker, daemon=True).start()
+                elif not self._saturated:
+                    self._saturated = True
+                    logging.debug("all %d plugin workers are busy, callbacks are queueing up" % self.max_workers)
+            self._cond.notify()
+
+    def _plugin_stats(self, plugin_name):
+        if plugin_name not in self._stats:
+            self._stats[plugin_name] = {'queued': 0, 'max_queued': 0, 'calls': 0, 'errors': 0,
+                                        'wait_total': 0.0, 'wait_max': 0.0, 'run_total': 0.0, 'run_max': 0.0}
+        return self._stats[plugin_name]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._idle += 1
+                while not self._ready:
+                    if not self._cond.wait(WORKER_IDLE_TIMEOUT) and not self._ready:
+                        self._idle -= 1
+                        self._workers -= 1
+                        return
+                self._idle -= 1
+                self._saturated = False
+                _, _, lock_name = heapq.heappop(self._ready)
+                priority, submitted, callback, args, kwargs = self._queues[lock_name].popleft()
+                plugin_name = lock_name.split('::')[0]
+
+            started = time.monotonic()
+            try:
+                locked_cb(lock_name, callback, *args, **kwargs)
+            except Exception as e:
+                with self._cond:
+                    self._stats[plugin_name]['errors'] += 1
+                logging.error("error while running %s : %s" % (lock_name, e))
+                logging.error(e, exc_info=True)
+            finished = time.monotonic()
+
+            with self._cond:
+                stats = self._stats[plugin_name]
+                stats['queued'] -= 1
+                stats['calls'] += 1
+                stats['wait_total'] += started - submitted
+                stats['wait_max'] = max(stats['wait_max'], started - submitted)
+                stats['run_total'] += finished - started
+                stats['run_max'] = max(stats['run_max'], finished - started)
+
+                queue = self._queues[lock_name]
+                if queue:
+                    # go to the back of the line so a busy callback can't starve the others
+                    heapq.heappush(self._ready, (min(c[0] for c in queue), next(self._seq), lock_name))
+                    self._cond.notify()
+                else:
+                    del self._queues[lock_name]
+                    self._scheduled.discard(lock_name)
+
+    def stats(self):
+        """
+        Returns per plugin the number of queued or running callbacks, completed calls and errors,
+        and the average and maximum time in milliseconds calls waited in the queue and took to run.
+        """
+        with self._cond:
+            report = {}
+            for plugin_name, stats in self._stats.items():
+                calls = stats['calls']
+                report[plugin_name] = {
+                    'queued': stats['queued'],
+                    'max_queued': stats['max_queued'],
+                    'calls': calls,
+                    'errors': stats['errors'],
+                    'avg_wait_ms': round(stats['wait_total'] / calls * 1000, 1) if calls else None,
+                    'max_wait_ms': round(stats['wait_max'] * 1000, 1),
+                    'avg_run_ms': round(stats['run_total'] / calls * 1000, 1) if calls else None,
+                    'max_run_ms': round(stats['run_max'] * 1000, 1),
+                }
+            report['_pool'] = {'workers': self._workers, 'idle': self._idle, 'max_workers': self.max_workers}
+            return report
+
+
+dispatcher = Dispatcher()
+
 
 class Plugin:
     @classmethod
@@ -22,7 +179,9 @@ class Plugin:
         plugin_name = cls.__module__.split('.')[0]
         plugin_instance = cls()
         logging.debug("loaded plugin %s as %s" % (plugin_name, plugin_instance))
-        loaded[plugin_name] = plugin_instance
+        # plugins loading in the background register while other threads iterate loaded
+        with _load_lock:
+            loaded[plugin_name] = plugin_instance
 
         for attr_name in plugin_instance.__dir__():
             if attr_name.startswith('on_'):
@@ -38,7 +197,7 @@ def toggle_plugin(name, enable=True):
     """
     import stenogotchi
     from stenogotchi.ui import view
-    from stenogotchi.utils import save_config
+    from stenogotchi.utils import save_config_later
   
     global loaded, database
 
@@ -52,12 +211,26 @@ def toggle_plugin(name, enable=True):
         if not name in stenogotchi.config['main']['plugins']:
             stenogotchi.config['main']['plugins'][name] = dict()
         stenogotchi.config['main']['plugins'][name]['enabled'] = enable
-        save_config(stenogotchi.config, '/etc/stenogotchi/config.toml')
+        save_config_later({'main': {'plugins': {name: {'enabled': enable}}}}, '/etc/stenogotchi/config.toml')
+
+    if enable and (name in deferred or name in loading):
+        ensure_loaded(name)
+        return True
+
+    with _load_lock:
+        undeferred = not enable and deferred.pop(name, None) is not None
+    if undeferred:
+        return True
+
+    if name in loading:
+        # unload it once the background load has set it up
+        ensure_loaded(name)
 
     if not enable and name in loaded:
         if getattr(loaded[name], 'on_unload', None):
             loaded[name].on_unload(view.ROOT)
-        del loaded[name]
+        with _load_lock:
+            del loaded[name]
 
         return True
 
@@ -76,7 +249,20 @@ def toggle_plugin(name, enable=True):
 
 
 def on(event_name, *args, **kwargs):
-    for plugin_name in loaded.keys():
+    with _load_lock:
+        if event_name in LIFECYCLE_EVENTS:
+            _lifecycle[event_name] = (args, kwargs)
+        else:
+            for plugin_name in [name for name in deferred if event_name in metadata[name]['events']]:
+                _start_loading([(plugin_name, deferred.pop(plugin_name))], 'lazy')
+
+            for plugin_name in loading:
+                if plugin_name in metadata and event_name in metadata[plugin_name]['events']:
+                    _buffered[plugin_name].append((event_name, args, kwargs))
+
+        plugin_names = [name for name in list(loaded) if name not in loading]
+
+    for plugin_name in plugin_names:
         one(plugin_name, event_name, *args, **kwargs)
 
 
@@ -86,8 +272,71 @@ def locked_cb(lock_name, cb, *args, **kwargs):
     if lock_name not in locks:
         locks[lock_name] = threading.Lock()
 
+    requested = time.perf_counter()
     with locks[lock_name]:
-        cb(*args, *kwargs)
+        started = time.perf_counter()
+        try:
+            cb(*args, **kwargs)
+        finally:
+            _record_call(lock_name, started - requested, time.perf_counter() - started)
+
+
+def _record_call(lock_name, lock_wait, duration):
+    with profile_lock:
+        if lock_name not in profile:
+            profile[lock_name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'lock_wait': 0.0, 'lock_wait_max': 0.0,
+                                  'slow': 0, 'durations': deque(maxlen=PROFILE_SAMPLES)}
+        entry = profile[lock_name]
+        entry['calls'] += 1
+        entry['total'] += duration
+        entry['max'] = max(entry['max'], duration)
+        entry['lock_wait'] += lock_wait
+        entry['lock_wait_max'] = max(entry['lock_wait_max'], lock_wait)
+        entry['durations'].append(duration)
+        if duration > SLOW_CALLBACK_TIME:
+            entry['slow'] += 1
+
+    plugin_name, cb_name = lock_name.split('::', 1)
+    if cb_name == 'on_loaded' and plugin_name in boot_timings and boot_timings[plugin_name]['loaded_ms'] is None:
+        boot_timings[plugin_name]['loaded_ms'] = round(duration * 1000, 1)
+        logging.info("plugin %s on_loaded took %.0fms" % (plugin_name, duration * 1000))
+
+    if duration > SLOW_CALLBACK_TIME:
+        logging.debug("slow plugin callback %s took %.0fms" % (lock_name, duration * 1000))
+
+
+def profile_stats():
+    """
+    Returns timings of every plugin::callback that has run, slowest total first, in milliseconds.
+    The 95th percentile is taken over the last PROFILE_SAMPLES calls.
+    """
+    with profile_lock:
+        entries = [(name, dict(entry, durations=sorted(entry['durations']))) for name, entry in profile.items()]
+
+    stats = []
+    for name, entry in entries:
+        durations = entry['durations']
+        stats.append({
+            'callback': name,
+            'calls': entry['calls'],
+            'slow': entry['slow'],
+            'total_ms': round(entry['total'] * 1000, 1),
+            'avg_ms': round(entry['total'] / entry['calls'] * 1000, 1),
+            'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 1),
+            'max_ms': round(entry['max'] * 1000, 1),
+            'lock_wait_ms': round(entry['lock_wait'] * 1000, 1),
+            'lock_wait_max_ms': round(entry['lock_wait_max'] * 1000, 1),
+        })
+    stats.sort(key=lambda s: s['total_ms'], reverse=True)
+    return stats
+
+
+def profile_report():
+    columns = ('callback', 'calls', 'slow', 'total_ms', 'avg_ms', 'p95_ms', 'max_ms', 'lock_wait_ms', 'lock_wait_max_ms')
+    rows = [columns] + [tuple(str(s[c]) for c in columns) for s in profile_stats()]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                                for i, cell in enumerate(row)) for row in rows)
 
 
 def one(plugin_name, event_name, *args, **kwargs):
@@ -100,8 +349,8 @@ def one(plugin_name, event_name, *args, **kwargs):
         if callback is not None and callable(callback):
             try:
                 lock_name = "%s::%s" % (plugin_name, cb_name)
-                locked_cb_args = (lock_name, callback, *args, *kwargs)
-                _thread.start_new_thread(locked_cb, locked_cb_args)
+                priority = PRIORITY_HIGH if event_name in PRIORITY_EVENTS else PRIORITY_NORMAL
+                dispatcher.submit(plugin_name, lock_name, callback, args, kwargs, priority)
             except Exception as e:
                 logging.error("error while running %s.%s : %s" % (plugin_name, cb_name, e))
                 logging.error(e, exc_info=True)
@@ -116,23 +365,177 @@ def load_from_file(filename):
     return plugin_name, instance
 
 
-def load_from_path(path, enabled=()):
+def read_metadata(filename):
+    """
+    Parses a plugin without importing it and returns the events its plugin class handles, taken
+    from its on_* methods, and whether it sets __lazy__ = True to be imported only once one of
+    those events (other than the lifecycle ones) fires. Returns None if no plugin class is found.
+    """
+    with open(filename, 'rb') as fp:
+        tree = ast.parse(fp.read(), filename)
+
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        attributes = {}
+        for item in node.body:
+            if not isinstance(item, ast.Assign):
+                continue
+            try:
+                # literal_eval rather than ast.Constant, which Python 3.7 does not emit yet
+                value = ast.literal_eval(item.value)
+            except ValueError:
+                continue
+            for target in item.targets:
+                if isinstance(target, ast.Name):
+                    attributes[target.id] = value
+        if '__version__' not in attributes and '__description__' not in attributes:
+            continue
+        events = {item.name[3:] for item in node.body
+                  if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith('on_')}
+        return {'events': events, 'lazy': attributes.get('__lazy__') is True}
+
+    return None
+
+
+def _import_plugin(plugin_name, filename, mode):
+    started = time.perf_counter()
+    try:
+        load_from_file(filename)
+    except Exception as e:
+        logging.warning("error while loading %s: %s" % (filename, e))
+        logging.debug(e, exc_info=True)
+    import_ms = round((time.perf_counter() - started) * 1000, 1)
+    boot_timings[plugin_name] = {'mode': mode, 'import_ms': import_ms, 'loaded_ms': None}
+    logging.info("plugin %s imported in %.0fms (%s)" % (plugin_name, import_ms, mode))
+
+
+def _start_loading(plugins_to_load, mode):
+    """
+    Imports the given (name, filename) pairs one after another on a background thread.
+    """
+    for plugin_name, _ in plugins_to_load:
+        loading[plugin_name] = threading.Event()
+        _buffered[plugin_name] = deque(maxlen=MAX_BUFFERED_EVENTS)
+    threading.Thread(target=_load_late, args=(plugins_to_load, mode), daemon=True).start()
+
+
+def _load_late(plugins_to_load, mode):
+    """
+    Imports plugins after the others, then has a worker set them up in the background.
+    """
+    import stenogotchi
+
+    for plugin_name, filename in plugins_to_load:
+        _import_plugin(plugin_name, filename, mode)
+
+        if plugin_name in loaded:
+            if stenogotchi.config and plugin_name in stenogotchi.config['main']['plugins']:
+                loaded[plugin_name].options = stenogotchi.config['main']['plugins'][plugin_name]
+            # on a worker rather than here, so the next plugin is imported meanwhile
+            dispatcher.submit(plugin_name, "%s::_setup" % plugin_name, _setup_late, (plugin_name,),
+                              priority=PRIORITY_HIGH)
+        else:
+            with _load_lock:
+                done = loading.pop(plugin_name)
+                _buffered.pop(plugin_name)
+            done.set()
+
+
+def _setup_late(plugin_name):
+    """
+    Replays the lifecycle events which fired before a plugin finished loading one after the
+    other, so each callback finds the plugin set up by the previous ones. Events firing meanwhile
+    are buffered as the plugin still counts as loading, and are dispatched once it is set up
+    along with on_ready, which is left to run on its own as it may never return.
+    """
+    replayed = set()
+    while True:
+        with _load_lock:
+            lifecycle = [(event_name, event) for event_name, event in _lifecycle.items()
+                         if event_name != 'ready' and event_name not in replayed]
+            if not lifecycle:
+                done = loading.pop(plugin_name)
+                buffered = _buffered.pop(plugin_name)
+                if plugin_name in loaded:
+                    if 'ready' in _lifecycle:
+                        args, kwargs = _lifecycle['ready']
+                        one(plugin_name, 'ready', *args, **kwargs)
+                    for event_name, args, kwargs in buffered:
+                        one(plugin_name, event_name, *args, **kwargs)
+                break
+
+        for event_name, (args, kwargs) in lifecycle:
+            replayed.add(event_name)
+            if plugin_name in loaded:
+                _run_now(plugin_name, event_name, *args, **kwargs)
+    done.set()
+
+
+def _run_now(plugin_name, event_name, *args, **kwargs):
+    cb_name = 'on_%s' % event_name
+    callback = getattr(loaded[plugin_name], cb_name, None)
+    if callback is not None and callable(callback):
+        try:
+            locked_cb("%s::%s" % (plugin_name, cb_name), callback, *args, **kwargs)
+        except Exception as e:
+            logging.error("error while running %s.%s : %s" % (plugin_name, cb_name, e))
+            logging.error(e, exc_info=True)
+
+
+def ensure_loaded(plugin_name, timeout=None):
+    """
+    Imports a lazy plugin right away if it was not yet, or waits for it to finish loading.
+    Returns True if the plugin is loaded.
+    """
+    with _load_lock:
+        if plugin_name in deferred:
+            _start_loading([(plugin_name, deferred.pop(plugin_name))], 'lazy')
+        done = loading.get(plugin_name)
+
+    if done is not None:
+        done.wait(timeout)
+    return plugin_name in loaded and plugin_name not in loading
+
+
+def load_from_path(path, enabled=(), background=None):
     global loaded, database
     logging.debug("loading plugins from %s - enabled: %s" % (path, enabled))
     for filename in glob.glob(os.path.join(path, "*.py")):
         plugin_name = os.path.basename(filename.replace(".py", ""))
         database[plugin_name] = filename
         if plugin_name in enabled:
-            try:
-                load_from_file(filename)
-            except Exception as e:
-                logging.warning("error while loading %s: %s" % (filename, e))
-                logging.debug(e, exc_info=True)
+            meta = None
+            if background is not None:
+                try:
+                    meta = read_metadata(filename)
+                except Exception as e:
+                    logging.debug("can't read metadata of %s: %s" % (filename, e))
+
+            if meta is None:
+                _import_plugin(plugin_name, filename, 'boot')
+                continue
+
+            metadata[plugin_name] = meta
+            if meta['lazy']:
+                logging.debug("deferring import of plugin %s until one of %s" % (plugin_name, sorted(meta['events'])))
+                deferred[plugin_name] = filename
+            elif meta['events'] & UI_EVENTS:
+                _import_plugin(plugin_name, filename, 'boot')
+            else:
+                background.append((plugin_name, filename))
 
     return loaded
 
 
+def dispatch_stats():
+    return dispatcher.stats()
+
+
 def load(config):
+    dispatcher.max_workers = max(1, int(config['main'].get('plugin_workers', dispatcher.max_workers)))
+    background = [] if config['main'].get('plugin_background_load', True) else None
+
     enabled = [name for name, options in config['main']['plugins'].items() if
                'enabled' in options and options['enabled']]
     
@@ -143,17 +546,25 @@ def load(config):
     logging.debug(f"REMOVEME post status : '{enabled}'")
 
     # load default plugins
-    load_from_path(default_path, enabled=enabled)
+    load_from_path(default_path, enabled=enabled, background=background)
 
     # load custom ones
     custom_path = config['main']['custom_plugins'] if 'custom_plugins' in config['main'] else None
     if custom_path is not None:
-        load_from_path(custom_path, enabled=enabled)
+        load_from_path(custom_path, enabled=enabled, background=background)
 
     # propagate options
-    for name, plugin in loaded.items():
+    for name, plugin in list(loaded.items()):
         plugin.options = config['main']['plugins'][name]
         print("loaded plugin:", name, plugin)
 
     on('loaded')
-    on('config_changed', config)
\ No newline at end of file
+    on('config_changed', config)
+
+    logging.info("imported %d plugins at boot in %.0fms, %d left to load in the background, %d deferred" % (
+        len(boot_timings), sum(t['import_ms'] for t in boot_timings.values()), len(background or ()), len(deferred)))
+
+    # plugins without ui callbacks are imported while the ui is set up
+    if background:
+        with _load_lock:
+            _start_loading(background, 'background')
\ No newline at end of file
@@ -461,9 +461,11 @@ class Buttonshim(plugins.Plugin):
     
     def toggle_wpm_meters(self):
         command = {}
+        options = {}
         try:
-            wpm_method = plugins.loaded['plover_link'].options['wpm_method']
-            wpm_timeout = plugins.loaded['plover_link'].options['wpm_timeout']
+            options = plugins.loaded['plover_link'].options or {}
+            wpm_method = options['wpm_method']
+            wpm_timeout = options['wpm_timeout']
         except Exception as ex:
             logging.exception(f"[buttonshim] Check that wpm_method and wpm_timeout is configured. Falling back to defaults. Exception: {str(ex)}")
             wpm_method = 'ncra'
@@ -479,7 +481,11 @@ class Buttonshim(plugins.Plugin):
         elif not self._plover_wpm_meters_enabled:
             command = {'start_wpm_meter': 'wpm and strokes',
                         'wpm_method' : wpm_method,
-                        'wpm_timeout' : wpm_timeout}
+                        'wpm_timeout' : wpm_timeout,
+                        'wpm_publish' : options.get('wpm_publish', 'interval'),
+                        'wpm_publish_interval' : options.get('wpm_publish_interval', '10'),
+                        'wpm_publish_delta' : options.get('wpm_publish_delta', '0'),
+                        'strokes_publish_delta' : options.get('strokes_publish_delta', '0')}
 
             self.set_ui_update('wpm', wpm_method)
             self.set_ui_update('strokes', f"{wpm_timeout}s")
@@ -17,7 +17,7 @@ class UiHandler():
         self._agent = agent
         self._view = view.ROOT
         self._stored_state = state.State()
-        self.minion_font = fonts.ImageFont.truetype("%s-Bold" % fonts.FONT_NAME, 18)
+        self.minion_font = fonts.get("%s-Bold" % fonts.FONT_NAME, 18)
         self.minion_offset = 65
      
     def store_state(self):
@@ -19,6 +19,9 @@ class Example(plugins.Plugin):
     __version__ = '1.0.0'
     __license__ = 'GPL3'
     __description__ = 'An example plugin for pwnagotchi that implements all the available callbacks.'
+    # set to True to only import the plugin once one of its callbacks, other than loaded, config_changed,
+    # display_setup, ui_setup and ready, is first triggered. e.g. on the first request to on_webhook
+    __lazy__ = False
 
     def __init__(self):
         logging.debug("[example] example plugin created")
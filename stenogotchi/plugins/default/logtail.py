@@ -237,6 +237,7 @@ class Logtail(plugins.Plugin):
     __version__ = '0.1.0'
     __license__ = 'GPL3'
     __description__ = 'This plugin tails the logfile.'
+    __lazy__ = True
 
     def __init__(self):
         self.lock = threading.Lock()
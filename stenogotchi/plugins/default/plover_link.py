@@ -16,7 +16,9 @@ from types import MethodDescriptorType
 import dbus
 import dbus.service
 import socket
+import threading
 
+from collections import deque
 from time import sleep
 from gi.repository import GLib
 from dbus.mainloop.glib import DBusGMainLoop
@@ -27,6 +29,12 @@ if not __name__ == '__main__':
 else:
     ObjectClass = object
 
+# Size of a single HID report: 0xA1, report id, modifiers, reserved and six keys
+HID_REPORT_LENGTH = 10
+# Maximum number of simultaneously pressed normal keys in a boot keyboard report
+HID_ROLLOVER = 6
+
+
 class BluezErrorRejected(dbus.DBusException):
     _dbus_error_name = "org.bluez.Error.Rejected"
 
@@ -101,6 +109,88 @@ class HumanInterfaceDeviceProfile(dbus.service.Object):
                     self.fd = -1
        
 
+class HIDReportScheduler:
+    """
+    Owns all writes to the BT interrupt socket. HID reports from Plover and evdevkb
+    are queued and written by a dedicated thread, paced with the interval configured
+    for the connected host. With coalescing enabled, a key release followed by the
+    press of another key is merged into a single rollover report while reports are
+    backed up in the queue.
+    """
+    def __init__(self, device, interval=0.0, host_intervals=None, coalesce=False):
+        self._device = device
+        self._default_interval = interval
+        self._host_intervals = host_intervals or {}
+        self.interval = interval
+        self.coalesce = coalesce
+        self.reports_sent = 0
+        self.reports_coalesced = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_host(self, mac):
+        """ Applies the pacing interval configured for the connected host """
+        self.interval = self._host_intervals.get(mac, self._default_interval)
+        logging.debug(f'[plover_link] HID report interval for {mac}: {self.interval * 1000:.1f}ms')
+
+    def submit(self, reports):
+        with self._cond:
+            self._queue.extend(reports)
+            self._cond.notify()
+
+    def clear(self):
+        """ Drops all queued reports, e.g. when the host disconnects """
+        with self._cond:
+            self._queue.clear()
+
+    def _run(self):
+        last = None
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                report = self._queue.popleft()
+                if self.coalesce and last is not None and self._queue:
+                    merged = self._merge_rollover(last, report, self._queue[0])
+                    if merged is not None:
+                        self._queue.popleft()
+                        self.reports_coalesced += 1
+                        report = merged
+            try:
+                self._device.cinterrupt.send(report)
+                self.reports_sent += 1
+            except (OSError, AttributeError) as ex:
+                logging.error(f"[plover_link] Failed to send HID report: {ex}")
+            last = report
+            if self.interval:
+                sleep(self.interval)
+
+    @staticmethod
+    def _merge_rollover(last, release, press):
+        """
+        Returns a report pressing the keys of both last and press if release only
+        lets go of the keys in last and press adds different keys using the same
+        modifiers. The host then sees the new keys go down while the previous ones
+        are still held, like rollover typing. Returns None if the reports can't be
+        merged safely.
+        """
+        if not len(last) == len(release) == len(press) == HID_REPORT_LENGTH:
+            return None
+        if not last[2] == release[2] == press[2]:
+            return None
+        if any(release[4:]):
+            return None
+        held = [key for key in last[4:] if key]
+        pressed = [key for key in press[4:] if key]
+        if not held or not pressed or set(held) & set(pressed) or len(held) + len(pressed) > HID_ROLLOVER:
+            return None
+        # New keys go first, matching the order used by the keyboard clients
+        keys = pressed + held
+        return bytes([*press[:4], *keys, *[0] * (HID_ROLLOVER - len(keys))])
+
+
 class BTKbDevice:
     """
     Create a bluetooth device to emulate a HID keyboard
@@ -173,7 +263,27 @@ class BTKbDevice:
         else:
             self.bt_autoconnect_list = None
 
+        # Set up pacing of HID reports sent to the host
+        options = plugins.loaded['plover_link'].options
+        self.scheduler = HIDReportScheduler(self,
+                                            interval=float(options.get('hid_report_interval', 0)) / 1000,
+                                            host_intervals=self.parse_host_intervals(options.get('hid_report_interval_hosts', '')),
+                                            coalesce=options.get('hid_coalesce', False))
+
         logging.info('[plover_link] Configured BT device with name {}'.format(self.alias))
+
+    @staticmethod
+    def parse_host_intervals(hosts_str):
+        """ Parses 'MAC = ms, MAC = ms' into a dict of MAC to interval in seconds """
+        host_intervals = {}
+        if hosts_str:
+            for item in hosts_str.split(','):
+                mac, _, interval = item.partition('=')
+                try:
+                    host_intervals[mac.strip().upper()] = float(interval) / 1000
+                except ValueError:
+                    logging.error(f"[plover_link] Invalid hid_report_interval_hosts entry: '{item.strip()}'")
+        return host_intervals
     
     def interfaces_added(self, path, device_info):
         pass
@@ -189,6 +299,7 @@ class BTKbDevice:
             return
 
         logging.info('[plover_link] The client has been disconnected')
+        self.scheduler.clear()
         self.bthost_mac = None
         self.bthost_name = ""
         self._agent.set_bt_disconnected()
@@ -354,6 +465,7 @@ class BTKbDevice:
             
             self.bthost_mac = cinfo[0]
             self.bthost_name = self.get_connected_device_name()
+            self.scheduler.set_host(self.bthost_mac.upper())
 
             self._agent.set_bt_connected(self.bthost_name)
             self.bt_last_conn = self.bthost_mac
@@ -429,6 +541,7 @@ class BTKbDevice:
                     self.autoconnect_in_progress = False
                     self.bthost_mac = i
                     self.bt_last_conn = i
+                    self.scheduler.set_host(i.upper())
                     self.bthost_name = self.get_connected_device_name()
                     self._agent.set_bt_connected(self.bthost_name)
                     return True # stop trying to auto connect upon success
@@ -497,7 +610,19 @@ class BTKbDevice:
         Send HID message
         :param msg: (bytes) HID packet to send
         """
-        self.cinterrupt.send(bytes(bytearray(msg)))
+        self.scheduler.submit([bytes(bytearray(msg))])
+
+    def send_buffer(self, buf):
+        """
+        Send HID messages packed back to back in a single buffer
+        :param buf: (bytes) HID packets of HID_REPORT_LENGTH bytes each
+        """
+        if len(buf) % HID_REPORT_LENGTH:
+            logging.error(f"[plover_link] Dropped HID buffer of {len(buf)} bytes, not a multiple of {HID_REPORT_LENGTH}")
+            return
+        view = memoryview(buf)
+        self.scheduler.submit([view[offset:offset + HID_REPORT_LENGTH].tobytes()
+                               for offset in range(0, len(view), HID_REPORT_LENGTH)])
 
 
 class StenogotchiService(dbus.service.Object):
@@ -528,6 +653,10 @@ class StenogotchiService(dbus.service.Object):
         for key in key_list:
             self.device.send(key)
 
+    @dbus.service.method('com.github.stenogotchi', in_signature='ay', byte_arrays=True)   # bytearray of packed HID reports
+    def send_keys_buffer(self, buf):
+        self.device.send_buffer(buf)
+
     @dbus.service.method('com.github.stenogotchi', in_signature='b')    # boolean
     def plover_is_running(self, b):
         logging.debug('[plover_link] plover_is_running = ' + str(b))
@@ -622,6 +751,7 @@ class PloverLink(ObjectClass):
             logging.error("[plover_link] Could not start PloverLink")
 
     def on_plover_ready(self, agent):
+        self.send_signal_to_plover({'hid_rollover': self.options.get('hid_rollover', True)})
         self._stenogotchiservice.auto_connect()
     
     def on_config_changed(self, config):
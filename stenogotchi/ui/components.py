@@ -1,6 +1,67 @@
-from PIL import Image
+from functools import lru_cache
+from PIL import Image, ImageDraw
 from textwrap import TextWrapper
 
+# Number of wrapped texts and rendered text bitmaps kept for reuse across redraws
+TEXT_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def wrap_text(value, width):
+    return '\n'.join(TextWrapper(width=width, replace_whitespace=False).wrap(value))
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(text, font, fontmode='1'):
+    """
+    Rasterises text once, returning its (x0, y0, x1, y1) box relative to the drawing
+    position and a mask of its pixels, the mask being None when nothing is drawn.
+    """
+    mode = '1' if fontmode == '1' else 'L'
+    bbox = ImageDraw.Draw(Image.new(mode, (1, 1))).textbbox((0, 0), text, font=font)
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    if width <= 0 or height <= 0:
+        return bbox, None
+    mask = Image.new(mode, (width, height), 0)
+    ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), text, font=font, fill=255)
+    return bbox, mask
+
+
+def _cacheable(xy, font):
+    # fractional positions are rasterised with sub-pixel offsets, draw those directly
+    return font is not None and float(xy[0]).is_integer() and float(xy[1]).is_integer()
+
+
+def draw_text(canvas, drawer, xy, text, font, color):
+    """ Same as drawer.text(xy, text, font=font, fill=color), pasting a cached bitmap """
+    if not _cacheable(xy, font):
+        drawer.text(xy, text, font=font, fill=color)
+        return
+    bbox, mask = render_text(text, font, drawer.fontmode)
+    if mask is not None:
+        canvas.paste(color, (int(xy[0]) + bbox[0], int(xy[1]) + bbox[1]), mask)
+
+
+def text_bbox(drawer, xy, text, font):
+    """ Same as drawer.textbbox(xy, text, font=font), using the cached bitmap box """
+    if not _cacheable(xy, font):
+        return drawer.textbbox(xy, text, font=font)
+    bbox, _ = render_text(text, font, drawer.fontmode)
+    return int(xy[0]) + bbox[0], int(xy[1]) + bbox[1], int(xy[0]) + bbox[2], int(xy[1]) + bbox[3]
+
+
+def union(a, b):
+    """ Returns the smallest box (x0, y0, x1, y1) containing both boxes, either of which may be None """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
 
 class Widget(object):
     def __init__(self, xy, color=0):
@@ -10,6 +71,14 @@ class Widget(object):
     def draw(self, canvas, drawer):
         raise Exception("not implemented")
 
+    def bbox(self, drawer):
+        """
+        Returns the box (x0, y0, x1, y1) of the pixels draw() would touch, or None if
+        nothing is drawn. Widgets which can't tell raise NotImplementedError, forcing
+        a full redraw whenever they change.
+        """
+        raise NotImplementedError()
+
 
 class Bitmap(Widget):
     def __init__(self, path, xy, color=0):
@@ -19,6 +88,9 @@ class Bitmap(Widget):
     def draw(self, canvas, drawer):
         canvas.paste(self.image, self.xy)
 
+    def bbox(self, drawer):
+        return self.xy[0], self.xy[1], self.xy[0] + self.image.width, self.xy[1] + self.image.height
+
 
 class Line(Widget):
     def __init__(self, xy, color=0, width=1):
@@ -28,13 +100,24 @@ class Line(Widget):
     def draw(self, canvas, drawer):
         drawer.line(self.xy, fill=self.color, width=self.width)
 
+    def bbox(self, drawer):
+        pad = self.width // 2 + 1
+        x0, y0, x1, y1 = self.xy
+        return min(x0, x1) - pad, min(y0, y1) - pad, max(x0, x1) + pad, max(y0, y1) + pad
+
+
+class _BoxWidget(Widget):
+    def bbox(self, drawer):
+        x0, y0, x1, y1 = self.xy
+        return min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1
 
-class Rect(Widget):
+
+class Rect(_BoxWidget):
     def draw(self, canvas, drawer):
         drawer.rectangle(self.xy, outline=self.color)
 
 
-class FilledRect(Widget):
+class FilledRect(_BoxWidget):
     def draw(self, canvas, drawer):
         drawer.rectangle(self.xy, fill=self.color)
 
@@ -46,15 +129,20 @@ class Text(Widget):
         self.font = font
         self.wrap = wrap
         self.max_length = max_length
-        self.wrapper = TextWrapper(width=self.max_length, replace_whitespace=False) if wrap else None
+
+    def text(self):
+        if self.wrap:
+            return wrap_text(self.value, self.max_length)
+        return self.value
 
     def draw(self, canvas, drawer):
         if self.value is not None:
-            if self.wrap:
-                text = '\n'.join(self.wrapper.wrap(self.value))
-            else:
-                text = self.value
-            drawer.text(self.xy, text, font=self.font, fill=self.color)
+            draw_text(canvas, drawer, self.xy, self.text(), self.font, self.color)
+
+    def bbox(self, drawer):
+        if self.value is None:
+            return None
+        return text_bbox(drawer, self.xy, self.text(), self.font)
 
 
 class LabeledValue(Widget):
@@ -67,15 +155,28 @@ class LabeledValue(Widget):
         self.text_font = text_font
         self.label_spacing = label_spacing
 
-    def draw(self, canvas, drawer):
+    def _value(self):
         if self.max_length > 0:
-            value = self.value[:self.max_length]
-        else:
-            value = self.value
+            return self.value[:self.max_length]
+        return self.value
+
+    def _value_xy(self):
+        return self.xy[0] + self.label_spacing + 5 * len(self.label), self.xy[1]
+
+    def draw(self, canvas, drawer):
+        value = self._value()
 
         if self.label is None:
-            drawer.text(self.xy, value, font=self.label_font, fill=self.color)
+            draw_text(canvas, drawer, self.xy, value, self.label_font, self.color)
         else:
             pos = self.xy
-            drawer.text(pos, self.label, font=self.label_font, fill=self.color)
-            drawer.text((pos[0] + self.label_spacing + 5 * len(self.label), pos[1]), value, font=self.text_font, fill=self.color)
+            draw_text(canvas, drawer, pos, self.label, self.label_font, self.color)
+            draw_text(canvas, drawer, self._value_xy(), value, self.text_font, self.color)
+
+    def bbox(self, drawer):
+        value = self._value()
+
+        if self.label is None:
+            return text_bbox(drawer, self.xy, value, self.label_font)
+        return union(text_bbox(drawer, self.xy, self.label, self.label_font),
+                     text_bbox(drawer, self._value_xy(), value, self.text_font))
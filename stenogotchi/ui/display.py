@@ -1,6 +1,10 @@
 import os
+import time
 import logging
 import threading
+from collections import deque
+
+from PIL import ImageChops
 
 import stenogotchi.plugins as plugins
 import stenogotchi.ui.hw as hw
@@ -14,11 +18,27 @@ class Display(View):
 
         self._enabled = config['enabled']
         self._rotation = config['rotation']
+        self._min_refresh_interval = float(config.get('min_refresh_interval', 0.0))
+        self._full_refresh_every = int(config.get('full_refresh_every', 0))
 
         self.init_display()
 
         self._canvas_next_event = threading.Event()
         self._canvas_next = None
+        # regions changed since the display was last refreshed, None when a full refresh is due
+        self._regions_next = None
+        self._canvas_next_lock = threading.Lock()
+        # last canvas pushed to the display, diffed against to skip unchanged frames
+        self._canvas_last = None
+        self._frames_submitted = 0
+        self._frames_rendered = 0
+        self._frames_skipped = 0
+        self._bytes_saved = 0
+        self._full_refreshes = 0
+        self._partials_since_full = 0
+        self._last_refresh = 0.0
+        # (kind, seconds) of the latest panel refreshes
+        self._refresh_timings = deque(maxlen=100)
         self._render_thread_instance = threading.Thread(
             target=self._render_thread,
             daemon=True
@@ -45,13 +65,87 @@ class Display(View):
             img = self._canvas if self._rotation == 0 else self._canvas.rotate(-self._rotation)
         return img
 
+    def render_stats(self):
+        """
+        Returns counters of frames pushed to, skipped and coalesced by the display,
+        the packed pixel bytes which did not have to be sent thanks to the frame diff,
+        and the duration of recent refreshes in milliseconds.
+        """
+        timings = [seconds * 1000 for kind, seconds in list(self._refresh_timings)]
+        return {
+            'frames_submitted': self._frames_submitted,
+            'frames_rendered': self._frames_rendered,
+            'frames_skipped': self._frames_skipped,
+            'frames_coalesced': self._frames_submitted - self._frames_rendered - self._frames_skipped,
+            'full_refreshes': self._full_refreshes,
+            'bytes_saved': self._bytes_saved,
+            'last_refresh_ms': round(timings[-1], 1) if timings else None,
+            'avg_refresh_ms': round(sum(timings) / len(timings), 1) if timings else None,
+            'max_refresh_ms': round(max(timings), 1) if timings else None,
+        }
+
     def _render_thread(self):
         """Used for non-blocking screen updating."""
 
         while True:
             self._canvas_next_event.wait()
+            # hold off until the minimum interval has passed, frames arriving meanwhile
+            # replace the pending one and add to its regions so only the newest is drawn
+            delay = self._last_refresh + self._min_refresh_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
             self._canvas_next_event.clear()
-            self._implementation.render(self._canvas_next)
+            with self._canvas_next_lock:
+                canvas, regions = self._canvas_next, self._regions_next
+                self._regions_next = []
+
+            regions = self._changed_regions(canvas, regions)
+            if regions is not None:
+                full_size = self._packed_size((0, 0) + canvas.size)
+                self._bytes_saved += full_size - min(full_size, sum(self._packed_size(r) for r in regions))
+                if not regions:
+                    self._frames_skipped += 1
+                    logging.debug("skipping display refresh, frame unchanged")
+                    continue
+
+            full = 0 < self._full_refresh_every <= self._partials_since_full
+            started = time.monotonic()
+            if full:
+                # clear the ghosting left behind by partial refreshes
+                self._implementation.refresh(canvas)
+                self._partials_since_full = 0
+                self._full_refreshes += 1
+            else:
+                self._implementation.render(canvas, regions)
+                self._partials_since_full += 1
+            self._last_refresh = time.monotonic()
+            self._refresh_timings.append(('full' if full else 'partial', self._last_refresh - started))
+            logging.debug("display %s refresh took %.0fms" % ('full' if full else 'partial',
+                                                              (self._last_refresh - started) * 1000))
+            self._canvas_last = canvas
+            self._frames_rendered += 1
+
+    @staticmethod
+    def _packed_size(box):
+        return ((box[2] - box[0]) * (box[3] - box[1]) + 7) // 8
+
+    def _changed_regions(self, canvas, regions):
+        """
+        Shrinks regions, or the whole canvas when None, to the boxes where canvas differs
+        from the last frame pushed. Returns None when there is no comparable last frame.
+        """
+        last = self._canvas_last
+        if last is None or last.size != canvas.size or last.mode != '1' or canvas.mode != '1':
+            return regions
+        if regions is None:
+            regions = [(0, 0) + canvas.size]
+
+        changed = []
+        for box in regions:
+            bbox = ImageChops.logical_xor(last.crop(box), canvas.crop(box)).getbbox()
+            if bbox is not None:
+                changed.append((box[0] + bbox[0], box[1] + bbox[1], box[0] + bbox[2], box[1] + bbox[3]))
+        return changed
 
     def _on_view_rendered(self, img):
         try:
@@ -63,5 +157,11 @@ class Display(View):
         if self._enabled:
             self._canvas = (img if self._rotation == 0 else img.rotate(self._rotation))
             if self._implementation is not None:
-                self._canvas_next = self._canvas
+                with self._canvas_next_lock:
+                    self._frames_submitted += 1
+                    self._canvas_next = self._canvas
+                    if self._rotation != 0 or self._regions_next is None:
+                        self._regions_next = None
+                    else:
+                        self._regions_next.extend(self.dirty_regions())
                 self._canvas_next_event.set()
\ No newline at end of file
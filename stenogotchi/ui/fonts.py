@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from PIL import ImageFont
 
 # should not be changed
@@ -22,17 +24,26 @@ def init(config):
     setup(10, 9, 10, 35, 25, 9)
 
 
+@lru_cache(maxsize=None)
+def get(name, size):
+    """
+    Returns the TrueType font name at the given size. Each font is only loaded once and the same
+    object is shared by every caller, which also lets the widget text cache match on it.
+    """
+    return ImageFont.truetype(name, size)
+
+
 def status_font(old_font):
     global STATUS_FONT_NAME, SIZE_OFFSET
-    return ImageFont.truetype(STATUS_FONT_NAME, size=old_font.size + SIZE_OFFSET)
+    return get(STATUS_FONT_NAME, old_font.size + SIZE_OFFSET)
 
 
 def setup(bold, bold_small, medium, huge, bold_big, small):
     global Bold, BoldSmall, Medium, Huge, BoldBig, Small, FONT_NAME
 
-    Small = ImageFont.truetype(FONT_NAME, small)
-    Medium = ImageFont.truetype(FONT_NAME, medium)
-    BoldSmall = ImageFont.truetype("%s-Bold" % FONT_NAME, bold_small)
-    Bold = ImageFont.truetype("%s-Bold" % FONT_NAME, bold)
-    BoldBig = ImageFont.truetype("%s-Bold" % FONT_NAME, bold_big)
-    Huge = ImageFont.truetype("%s-Bold" % FONT_NAME, huge)
\ No newline at end of file
+    Small = get(FONT_NAME, small)
+    Medium = get(FONT_NAME, medium)
+    BoldSmall = get("%s-Bold" % FONT_NAME, bold_small)
+    Bold = get("%s-Bold" % FONT_NAME, bold)
+    BoldBig = get("%s-Bold" % FONT_NAME, bold_big)
+    Huge = get("%s-Bold" % FONT_NAME, huge)
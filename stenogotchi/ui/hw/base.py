@@ -41,8 +41,19 @@ class DisplayImpl(object):
     def initialize(self):
         raise NotImplementedError
 
-    def render(self, canvas):
+    def render(self, canvas, regions=None):
+        """
+        Pushes canvas to the display. regions optionally lists the (x0, y0, x1, y1)
+        boxes that changed since the last render, None meaning the whole canvas.
+        """
         raise NotImplementedError
 
+    def refresh(self, canvas):
+        """
+        Fully refreshes the display with canvas, clearing ghosting left by partial
+        updates. Displays without a separate full refresh just render.
+        """
+        self.render(canvas)
+
     def clear(self):
         raise NotImplementedError
\ No newline at end of file
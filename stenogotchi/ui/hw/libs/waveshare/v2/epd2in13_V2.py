@@ -59,6 +59,12 @@ BUSY_PIN = 24
 # SPI device, bus = 0, device = 0
 SPI = spidev.SpiDev(0, 0)
 
+# Largest single transfer spidev accepts, see /sys/module/spidev/parameters/bufsiz
+SPI_BUFSIZ = 4096
+
+# Translation table inverting every bit of a byte
+INVERT = bytes(0xFF - i for i in range(256))
+
 
 def digital_write(pin, value):
     GPIO.output(pin, value)
@@ -76,6 +82,12 @@ def spi_writebyte(data):
     SPI.writebytes(data)
 
 
+def spi_writebytes(data):
+    data = memoryview(data)
+    for i in range(0, len(data), SPI_BUFSIZ):
+        SPI.writebytes2(data[i:i + SPI_BUFSIZ])
+
+
 def module_init():
     GPIO.setmode(GPIO.BCM)
     GPIO.setwarnings(False)
@@ -156,10 +168,36 @@ class EPD:
         digital_write(self.dc_pin, GPIO.HIGH)
         spi_writebyte([data])
 
+    def send_data_buffer(self, data):
+        digital_write(self.dc_pin, GPIO.HIGH)
+        spi_writebytes(bytes(data))
+
     def wait_until_idle(self):
         while (digital_read(self.busy_pin) == 1):  # 0: idle, 1: busy
             delay_ms(100)
 
+    def SetWindow(self, x_start, y_start, x_end, y_end):
+        self.send_command(0x44)  # set Ram-X address start//end position, in bytes
+        self.send_data((x_start >> 3) & 0xFF)
+        self.send_data((x_end >> 3) & 0xFF)
+        self.send_command(0x45)  # set Ram-Y address start//end position
+        self.send_data(y_start & 0xFF)
+        self.send_data((y_start >> 8) & 0xFF)
+        self.send_data(y_end & 0xFF)
+        self.send_data((y_end >> 8) & 0xFF)
+
+    def SetCursor(self, x, y):
+        self.send_command(0x4E)  # set RAM x address count
+        self.send_data((x >> 3) & 0xFF)
+        self.send_command(0x4F)  # set RAM y address count
+        self.send_data(y & 0xFF)
+        self.send_data((y >> 8) & 0xFF)
+
+    def SetFullWindow(self):
+        # data entry mode 0x01 increments X and decrements Y, so rows are written from Y = height - 1 down
+        self.SetWindow(0, self.height - 1, self.width - 1, 0)
+        self.SetCursor(0, self.height - 1)
+
     def TurnOnDisplay(self):
         self.send_command(0x22)
         self.send_data(0xC7)
@@ -219,8 +257,7 @@ class EPD:
             self.send_data(self.lut_full_update[75])
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
+            self.send_data_buffer(self.lut_full_update[:70])
 
             self.send_command(0x4E)  # set RAM x address count to 0
             self.send_data(0x00)
@@ -235,8 +272,7 @@ class EPD:
             self.wait_until_idle()
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
+            self.send_data_buffer(self.lut_partial_update[:70])
 
             self.send_command(0x37)
             self.send_data(0x00)
@@ -262,55 +298,64 @@ class EPD:
         else:
             linewidth = self.width // 8 + 1
 
-        buf = [0xFF] * (linewidth * self.height)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
+        # mode '1' packs 8 pixels per byte MSB first with white as 1, matching the panel RAM,
+        # so only lines need reordering and padding to whole bytes
+        buf = Image.new('1', (linewidth * 8, self.height), 255)
 
         if (imwidth == self.width and imheight == self.height):
             # print("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[x // 8 + y * linewidth] &= ~(0x80 >> (x % 8))
+            # pixel x of a line is stored at bit imwidth - x
+            buf.paste(image_monocolor.transpose(Image.FLIP_LEFT_RIGHT), (1, 0))
         elif (imwidth == self.height and imheight == self.width):
             # print("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[newx // 8 + newy * linewidth] &= ~(0x80 >> (y % 8))
-        return buf
+            # canvas column x becomes buffer line x
+            buf.paste(image_monocolor.transpose(Image.TRANSPOSE), (0, 0))
+        return buf.tobytes()
 
     def display(self, image):
-        if self.width % 8 == 0:
-            linewidth = self.width // 8
-        else:
-            linewidth = self.width // 8 + 1
-
+        self.SetFullWindow()
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])
+        self.send_data_buffer(image)
         self.TurnOnDisplay()
 
     def displayPartial(self, image):
+        image = bytes(image)
+
+        self.SetFullWindow()
+        self.send_command(0x24)
+        self.send_data_buffer(image)
+        self.send_command(0x26)
+        self.send_data_buffer(image.translate(INVERT))
+        self.TurnOnDisplay()
+
+    def displayPartialWindows(self, image, windows):
+        """
+        Partial update transferring only the given windows of a getbuffer() image.
+        Each window is a box (x0, y0, x1, y1) in buffer coordinates, x being the pixel
+        column within a buffer line and y the buffer line, end exclusive. Columns are
+        widened to whole bytes.
+        """
         if self.width % 8 == 0:
             linewidth = self.width // 8
         else:
             linewidth = self.width // 8 + 1
 
-        self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])
-        self.send_command(0x26)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(~image[i + j * linewidth])
+        image = bytes(image)
+        for x0, y0, x1, y1 in windows:
+            i_start = x0 // 8
+            i_end = (x1 - 1) // 8
+            window = b''.join(image[i_start + j * linewidth:i_end + 1 + j * linewidth] for j in range(y0, y1))
+            # buffer line j lives at RAM Y address height - 1 - j
+            self.SetWindow(i_start * 8, self.height - 1 - y0, i_end * 8, self.height - 1 - (y1 - 1))
+
+            self.SetCursor(i_start * 8, self.height - 1 - y0)
+            self.send_command(0x24)
+            self.send_data_buffer(window)
+            self.SetCursor(i_start * 8, self.height - 1 - y0)
+            self.send_command(0x26)
+            self.send_data_buffer(window.translate(INVERT))
         self.TurnOnDisplay()
 
     def Clear(self, color):
@@ -320,10 +365,9 @@ class EPD:
             linewidth = self.width // 8 + 1
         # print(linewidth)
 
+        self.SetFullWindow()
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(color)
+        self.send_data_buffer(bytes([color]) * (linewidth * self.height))
         self.TurnOnDisplay()
 
     def sleep(self):
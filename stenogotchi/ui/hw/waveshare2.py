@@ -8,6 +8,8 @@ class WaveshareV2(DisplayImpl):
     def __init__(self, config):
         super(WaveshareV2, self).__init__(config, 'waveshare_2')
         self._display = None
+        # set once RAM 0x26 no longer mirrors the screen, forcing the next partial update to send the full frame
+        self._full_transfer = False
 
     def layout(self):
         if self.config['color'] == 'black':
@@ -89,9 +91,37 @@ class WaveshareV2(DisplayImpl):
         self._display.Clear(0xff)
         self._display.init(self._display.PART_UPDATE)
 
-    def render(self, canvas):
+    def render(self, canvas, regions=None):
         buf = self._display.getbuffer(canvas)
-        self._display.displayPartial(buf)
+        windows = None if self._full_transfer else self._windows_for(canvas, regions)
+        self._full_transfer = False
+        if windows is None:
+            self._display.displayPartial(buf)
+        elif windows:
+            self._display.displayPartialWindows(buf, windows)
+
+    def _windows_for(self, canvas, regions):
+        """
+        Maps canvas regions to display buffer windows, or returns None when the full
+        frame should be sent. Only landscape canvases, where buffer lines are canvas
+        columns, are windowed.
+        """
+        if regions is None or canvas.size != (self._display.height, self._display.width):
+            return None
+        windows = [(y0, x0, y1, x1) for x0, y0, x1, y1 in regions]
+        # columns are sent in whole bytes, fall back to a full frame once that is no cheaper
+        transfer = sum((x1 - x0) * ((y1 - 1) // 8 - y0 // 8 + 1) for y0, x0, y1, x1 in windows)
+        if transfer >= self._display.height * ((self._display.width + 7) // 8):
+            return None
+        return windows
+
+    def refresh(self, canvas):
+        buf = self._display.getbuffer(canvas)
+        self._display.init(self._display.FULL_UPDATE)
+        self._display.display(buf)
+        self._display.init(self._display.PART_UPDATE)
+        self._full_transfer = True
 
     def clear(self):
         self._display.Clear(0xff)
+        self._full_transfer = True
@@ -6,6 +6,7 @@ class State(object):
         self._state = state
         self._lock = Lock()
         self._listeners = {}
+        self._change_listeners = []
         self._changes = {}
 
     def add_element(self, key, elem):
@@ -23,6 +24,11 @@ class State(object):
         with self._lock:
             self._listeners[key] = cb
 
+    def add_change_listener(self, cb):
+        """ Registers cb(key, value), called on every recorded change of any key """
+        with self._lock:
+            self._change_listeners.append(cb)
+
     def items(self):
         with self._lock:
             return self._state.items()
@@ -35,6 +41,12 @@ class State(object):
         with self._lock:
             self._changes = {}
 
+    def take_changes(self):
+        """ Returns the keys changed since the last call and clears them in one step """
+        with self._lock:
+            changes, self._changes = list(self._changes.keys()), {}
+            return changes
+
     def changes(self, ignore=()):
         with self._lock:
             changes = []
@@ -57,3 +69,5 @@ class State(object):
                     self._changes[key] = True
                     if key in self._listeners and self._listeners[key] is not None:
                         self._listeners[key](prev, value)
+                    for cb in self._change_listeners:
+                        cb(key, value)
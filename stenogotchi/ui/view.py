@@ -27,11 +27,16 @@ class View(object):
 
         # setup faces from the configuration in case the user customized them
         faces.load_from_config(config['ui']['faces'])
+        web.setup(config)
 
         self._agent = None
         self._render_cbs = []
         self._config = config
         self._canvas = None
+        # persistent canvas only the changed regions are redrawn on, and the boxes widgets were last drawn in
+        self._draw_canvas = None
+        self._bboxes = {}
+        self._dirty_regions = []
         self._frozen = False
         self._lock = Lock()
         self._voice = Voice(lang=config['main']['lang'])
@@ -88,6 +93,11 @@ class View(object):
             for key, value in state.items():
                 self._state.set(key, value)
 
+        # push state changes to web UI clients subscribed to /events
+        for key in web.STATE_KEYS:
+            web.update_state(key, self._state.get(key))
+        self._state.add_change_listener(web.update_state)
+
         plugins.on('ui_setup', self)
 
         if config['ui']['fps'] > 0.0:
@@ -124,6 +134,13 @@ class View(object):
         if cb not in self._render_cbs:
             self._render_cbs.append(cb)
 
+    def dirty_regions(self):
+        """
+        Returns the (x0, y0, x1, y1) boxes of the canvas which changed in the last
+        rendered frame, a full redraw being a single box covering the whole canvas.
+        """
+        return list(self._dirty_regions)
+
     def _refresh_handler(self):
         delay = 1.0 / self._config['ui']['fps']
         while True:
@@ -361,17 +378,78 @@ class View(object):
             state = self._state
             changes = state.changes(ignore=self._ignore_changes)
             if force or len(changes):
-                self._canvas = Image.new('1', (self._width, self._height), WHITE)
-                drawer = ImageDraw.Draw(self._canvas)
-
+                # taken before drawing, values set meanwhile (e.g. by plugins handling ui_update,
+                # which run asynchronously) stay recorded for the next update
+                changes = state.take_changes()
                 plugins.on('ui_update', self)
 
-                for key, lv in state.items():
-                    lv.draw(self._canvas, drawer)
+                if force or self._draw_canvas is None:
+                    self._dirty_regions = self._redraw_all()
+                else:
+                    self._dirty_regions = self._redraw_changes(changes)
+
+                # the extent recorded for widgets changed while drawing may be of either value
+                for key in state.changes():
+                    self._bboxes.pop(key, None)
 
+                self._canvas = self._draw_canvas.copy()
                 web.update_frame(self._canvas)
 
                 for cb in self._render_cbs:
                     cb(self._canvas)
 
-                self._state.reset()
+    def _widget_bbox(self, widget, drawer):
+        try:
+            return widget.bbox(drawer)
+        except Exception:
+            # unknown extent, treat as covering the whole canvas
+            return 0, 0, self._width, self._height
+
+    def _clip(self, bbox):
+        if bbox is None:
+            return None
+        x0, y0, x1, y1 = (int(v) for v in bbox)
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, self._width), min(y1, self._height)
+        return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+    def _redraw_all(self):
+        self._draw_canvas = Image.new('1', (self._width, self._height), WHITE)
+        drawer = ImageDraw.Draw(self._draw_canvas)
+        self._bboxes = {}
+        for key, lv in self._state.items():
+            lv.draw(self._draw_canvas, drawer)
+            self._bboxes[key] = self._widget_bbox(lv, drawer)
+        return [(0, 0, self._width, self._height)]
+
+    def _redraw_changes(self, changes):
+        """
+        Redraws only the regions covered by changed widgets, before and after the change,
+        together with every other widget overlapping them. Returns the redrawn regions.
+        """
+        scratch = Image.new('1', (self._width, self._height), WHITE)
+        drawer = ImageDraw.Draw(scratch)
+        widgets = dict(self._state.items())
+
+        regions = []
+        for key in changes:
+            # where the widget was, and where it is drawn now. Widgets added since the last draw or
+            # changed while it ran have no known extent, which is treated as the whole canvas
+            old = self._bboxes.pop(key, (0, 0, self._width, self._height))
+            new = self._widget_bbox(widgets[key], drawer) if key in widgets else None
+            for bbox in (old, new):
+                region = self._clip(bbox)
+                if region is not None:
+                    regions.append(region)
+
+        if not regions:
+            return []
+
+        for key, lv in widgets.items():
+            bbox = self._bboxes.get(key) or self._widget_bbox(lv, drawer)
+            self._bboxes[key] = bbox
+            if bbox is not None and any(intersects(bbox, region) for region in regions):
+                lv.draw(scratch, drawer)
+
+        for region in regions:
+            self._draw_canvas.paste(scratch.crop(region), region[:2])
+        return regions
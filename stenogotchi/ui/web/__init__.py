@@ -1,15 +1,124 @@
 import os
+import json
+import time
+from io import BytesIO
+from queue import Queue, Full, Empty
 from threading import Lock
 
 frame_path = '/var/tmp/stenogotchi/stenogotchi.png'
 frame_format = 'PNG'
 frame_ctype = 'image/png'
 frame_lock = Lock()
+# write every frame to frame_path too, as needed by ui.web.on_frame commands reading the file
+frame_save = False
+
+# the latest frame is kept in memory and only encoded once a web client asks for it
+_frame = None
+_frame_version = 0
+_frame_bytes = None
+# distinguishes versions across restarts, so browsers don't revalidate against an older run
+_frame_epoch = '%x' % int(time.time())
+
+# state keys pushed to /events subscribers, with their latest values
+STATE_KEYS = ('face', 'status', 'wpm', 'strokes', 'mode', 'bthost')
+MAX_SUBSCRIBERS = 8
+SUBSCRIBER_QUEUE_SIZE = 64
+_state = {}
+_subscribers = []
+_subscribers_lock = Lock()
+
+
+def setup(config):
+    global frame_save
+    web_config = config['ui']['web']
+    frame_save = web_config.get('save_frame', False) or web_config.get('on_frame', '') != ''
 
 
 def update_frame(img):
-    global frame_lock, frame_path, frame_format
-    if not os.path.exists(os.path.dirname(frame_path)):
-        os.makedirs(os.path.dirname(frame_path))
+    global frame_lock, frame_path, frame_format, _frame, _frame_version, _frame_bytes
     with frame_lock:
-        img.save(frame_path, format=frame_format)
+        _frame = img
+        _frame_version += 1
+        _frame_bytes = None
+        version = _frame_version
+    publish('frame', {'version': version, 'etag': '"%s"' % frame_etag(version)})
+
+    if frame_save:
+        if not os.path.exists(os.path.dirname(frame_path)):
+            os.makedirs(os.path.dirname(frame_path))
+        with frame_lock:
+            img.save(frame_path, format=frame_format)
+
+
+def frame_etag(version):
+    return '%s-%d' % (_frame_epoch, version)
+
+
+def get_frame():
+    """
+    Returns the version and encoded bytes of the latest frame, (0, None) before
+    the first one. The frame is encoded on the first request for each version.
+    """
+    global frame_lock, frame_format, _frame_bytes
+    with frame_lock:
+        if _frame is None:
+            return 0, None
+        if _frame_bytes is None:
+            buf = BytesIO()
+            _frame.save(buf, format=frame_format)
+            _frame_bytes = buf.getvalue()
+        return _frame_version, _frame_bytes
+
+
+def update_state(key, value):
+    """ Records a state change and pushes it to /events subscribers """
+    if key not in STATE_KEYS:
+        return
+    value = None if value is None else str(value)
+    with _subscribers_lock:
+        _state[key] = value
+    publish('state', {key: value})
+
+
+def format_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+
+
+def publish(event, data):
+    message = format_event(event, data)
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for queue in subscribers:
+        try:
+            queue.put_nowait(message)
+        except Full:
+            # a stalled client only loses its oldest events
+            try:
+                queue.get_nowait()
+                queue.put_nowait(message)
+            except (Empty, Full):
+                pass
+
+
+def subscribe():
+    """
+    Returns a queue receiving every published event, preceded by the current state
+    and frame version, or None when MAX_SUBSCRIBERS are already connected.
+    """
+    queue = Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _subscribers_lock:
+        if len(_subscribers) >= MAX_SUBSCRIBERS:
+            return None
+        _subscribers.append(queue)
+        queue.put_nowait(format_event('state', dict(_state)))
+    with frame_lock:
+        version = _frame_version
+    if version:
+        queue.put_nowait(format_event('frame', {'version': version, 'etag': '"%s"' % frame_etag(version)}))
+    return queue
+
+
+def unsubscribe(queue):
+    with _subscribers_lock:
+        if queue in _subscribers:
+            _subscribers.remove(queue)
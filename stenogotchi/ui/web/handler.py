@@ -4,6 +4,7 @@ import _thread
 import secrets
 import subprocess
 from functools import wraps
+from queue import Empty
 
 # https://stackoverflow.com/questions/14888799/disable-console-messages-in-flask-server
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
@@ -13,7 +14,6 @@ import stenogotchi
 import stenogotchi.ui.web as web
 from stenogotchi import plugins
 
-from flask import send_file
 from flask import Response
 from flask import request
 from flask import abort
@@ -29,6 +29,7 @@ class Handler:
 
         self._app.add_url_rule('/', 'index', self.with_auth(self.index))
         self._app.add_url_rule('/ui', 'ui', self.with_auth(self.ui))
+        self._app.add_url_rule('/events', 'events', self.with_auth(self.events))
 
         self._app.add_url_rule('/shutdown', 'shutdown', self.with_auth(self.shutdown), methods=['POST'])
         
@@ -71,12 +72,18 @@ class Handler:
 
     def plugins(self, name, subpath):
         if name is None:
-            return render_template('plugins.html', loaded=plugins.loaded, database=plugins.database)
+            return render_template('plugins.html', loaded=plugins.loaded, database=plugins.database,
+                                   deferred=plugins.deferred, metadata=plugins.metadata)
 
         if name == 'toggle' and request.method == 'POST':
             checked = True if 'enabled' in request.form else False
             return 'success' if plugins.toggle_plugin(request.form['plugin'], checked) else 'failed'
 
+        if name == 'profile':
+            return render_template('profile.html', title=stenogotchi.name(), callbacks=plugins.profile_stats(),
+                                   dispatch=plugins.dispatch_stats())
+
+        plugins.ensure_loaded(name)
         if name in plugins.loaded and plugins.loaded[name] is not None and hasattr(plugins.loaded[name], 'on_webhook'):
             try:
                 return plugins.loaded[name].on_webhook(subpath, request)
@@ -163,7 +170,36 @@ class Handler:
         finally:
             _thread.start_new_thread(stenogotchi.restart, (mode,))
 
-    # serve the PNG file with the display image
+    # stream state changes, and frame versions unless ?frames=0, as server-sent events
+    def events(self):
+        queue = web.subscribe()
+        if queue is None:
+            return Response('Too many event subscribers', 503)
+        frames = request.args.get('frames', '1') != '0'
+
+        def stream():
+            try:
+                while True:
+                    try:
+                        message = queue.get(timeout=15)
+                    except Empty:
+                        # comment line keeping the connection and any proxies alive
+                        yield ': keepalive\n\n'
+                        continue
+                    if frames or not message.startswith('event: frame'):
+                        yield message
+            finally:
+                web.unsubscribe(queue)
+
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # serve the PNG with the display image, or 304 if the client already has the latest frame
     def ui(self):
-        with web.frame_lock:
-            return send_file(web.frame_path, mimetype='image/png')
+        version, frame = web.get_frame()
+        if frame is None:
+            abort(404)
+        response = Response(frame, mimetype=web.frame_ctype)
+        response.set_etag(web.frame_etag(version))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
@@ -3,8 +3,12 @@ import glob
 import os
 import sys
 import time
+import copy
+import atexit
+import threading
 
 import json
+import pickle
 import shutil
 import toml
 import sys
@@ -115,11 +119,122 @@ def load_configOLD(args):
     return config
 
 def save_config(config, target):
-    with open(target, 'wt') as fp:
+    from stenogotchi.fs import ensure_write
+    with ensure_write(target) as fp:
         fp.write(toml.dumps(config, encoder=DottedTomlEncoder()))
     return True
 
-def load_config(args):
+
+# seconds changes queued by save_config_later are held back, so a burst of them is written at once
+CONFIG_SAVE_DELAY = 2.0
+
+_pending_config = {}
+_pending_config_lock = threading.Lock()
+_pending_config_timer = None
+
+
+def save_config_later(changes, target, delay=CONFIG_SAVE_DELAY):
+    """
+    Queues changes, a nested dict of options, to be written to the user config at target. All
+    changes queued within delay seconds of the first are merged into what target already holds
+    and written in one go, instead of the whole merged configuration every time.
+    """
+    global _pending_config_timer
+
+    with _pending_config_lock:
+        _pending_config[target] = merge_config(copy.deepcopy(changes), _pending_config.get(target, {}))
+        if _pending_config_timer is None:
+            _pending_config_timer = threading.Timer(delay, flush_config)
+            _pending_config_timer.daemon = True
+            _pending_config_timer.start()
+            atexit.register(flush_config)
+
+
+def flush_config():
+    """
+    Writes out the changes queued by save_config_later right away.
+    """
+    global _pending_config_timer
+
+    with _pending_config_lock:
+        if _pending_config_timer is not None:
+            _pending_config_timer.cancel()
+            _pending_config_timer = None
+        atexit.unregister(flush_config)
+
+        for target, changes in _pending_config.items():
+            try:
+                user_config = {}
+                if os.path.exists(target):
+                    with open(target) as fp:
+                        user_config = toml.load(fp)
+                save_config(merge_config(changes, user_config), target)
+                logging.debug("saved configuration changes to %s" % target)
+            except Exception as ex:
+                logging.error("can't save configuration changes to %s: %s" % (target, ex))
+        _pending_config.clear()
+
+# merged configuration from the last boot, reused as long as none of its source files changed
+CONFIG_CACHE_PATH = '/var/cache/stenogotchi/config.pickle'
+CONFIG_CACHE_VERSION = 1
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (path, None, None)
+
+
+def _dropin_files(dropin):
+    if dropin and os.path.isdir(dropin):
+        return glob.glob(dropin + ('*.toml' if dropin.endswith('/') else '/*.toml'))
+    return []
+
+
+def _config_sources(ref_defaults_file, args, dropin):
+    return [_file_signature(path) for path in [ref_defaults_file, args.config, args.user_config] +
+            sorted(_dropin_files(dropin))]
+
+
+def _load_config_cache(cache_path, ref_defaults_file, args):
+    try:
+        with open(cache_path, 'rb') as fp:
+            cached = pickle.load(fp)
+        if cached['version'] != CONFIG_CACHE_VERSION or \
+                cached['sources'] != _config_sources(ref_defaults_file, args, cached['confd']):
+            return None
+        return cached['config']
+    except Exception:
+        return None
+
+
+def _save_config_cache(cache_path, sources, dropin, config):
+    from stenogotchi.fs import ensure_write
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with ensure_write(cache_path, 'wb') as fp:
+            pickle.dump({'version': CONFIG_CACHE_VERSION, 'sources': sources, 'confd': dropin, 'config': config},
+                        fp, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as ex:
+        print("can't write the configuration cache to %s: %s" % (cache_path, ex))
+
+
+def load_config(args, timings=None, use_cache=True):
+    """
+    Loads the defaults, the user configuration and the conf.d drop-ins, merged in that order. The
+    result is cached in CONFIG_CACHE_PATH and reused until any of those files change. When a list
+    is passed as timings, (step, milliseconds) pairs are appended to it.
+    """
+    started = time.perf_counter()
+
+    def timed(step):
+        nonlocal started
+        if timings is not None:
+            timings.append((step, round((time.perf_counter() - started) * 1000, 2)))
+        started = time.perf_counter()
+
     default_config_path = os.path.dirname(args.config)
     if not os.path.exists(default_config_path):
         os.makedirs(default_config_path)
@@ -141,6 +256,14 @@ def load_config(args):
         print("installing /boot/stenogotchi to /etc/stenogotchi ...")
         shutil.rmtree('/etc/stenogotchi', ignore_errors=True)
         shutil.move('/boot/stenogotchi', '/etc/')
+    timed('boot files')
+
+    cache_path = getattr(args, 'config_cache', CONFIG_CACHE_PATH)
+    if use_cache and cache_path:
+        config = _load_config_cache(cache_path, ref_defaults_file, args)
+        timed('cache lookup (%s)' % ('hit' if config is not None else 'miss'))
+        if config is not None:
+            return config
 
     # if not config is found, copy the defaults
     if not os.path.exists(args.config):
@@ -158,10 +281,14 @@ def load_config(args):
         if ref_defaults_data != defaults_data:
             print("!!! file in %s is different than release defaults, overwriting !!!" % args.config)
             shutil.copy(ref_defaults_file, args.config)
+    timed('defaults check')
+    # taken before the files are read, so a change made meanwhile invalidates the cache
+    sources = [_file_signature(path) for path in (ref_defaults_file, args.config, args.user_config)]
 
     # load the defaults
     with open(args.config) as fp:
         config = toml.load(fp)
+    timed('parse %s' % args.config)
 
     # load the user config
     try:
@@ -175,15 +302,17 @@ def load_config(args):
     except Exception as ex:
         logging.error("There was an error processing the configuration file:\n%s ",ex)
         sys.exit(1)
+    timed('parse and merge %s' % args.user_config)
 
     # dropins
     dropin = config['main']['confd']
-    if dropin and os.path.isdir(dropin):
-        dropin += '*.toml' if dropin.endswith('/') else '/*.toml'
-        for conf in glob.glob(dropin):
-            with open(conf) as toml_file:
-                additional_config = toml.load(toml_file)
-                config = merge_config(additional_config, config)
+    dropin_files = _dropin_files(dropin)
+    sources += [_file_signature(conf) for conf in sorted(dropin_files)]
+    for conf in dropin_files:
+        with open(conf) as toml_file:
+            additional_config = toml.load(toml_file)
+            config = merge_config(additional_config, config)
+        timed('parse and merge %s' % conf)
 
     # the very first step is to normalize the display name so we don't need dozens of if/elif around
     #if config['ui']['display']['type'] in ('inky', 'inkyphat'):
@@ -235,6 +364,10 @@ def load_config(args):
         print("unsupported display type %s" % config['ui']['display']['type'])
         sys.exit(1)
 
+    if cache_path:
+        _save_config_cache(cache_path, sources, dropin, config)
+        timed('cache write')
+
     return config
 
 def secs_to_hhmmss(secs):
@@ -0,0 +1,173 @@
+"""
+Checks that the 2.13" V2 e-paper driver builds byte-identical frame buffers to the per-pixel
+implementation it replaced, and measures how many frames per second each can pack.
+
+spidev and RPi.GPIO are replaced by minimal stand-ins so the driver imports off a Raspberry Pi.
+
+Run with `python -m pytest tests` or `python tests/test_epd_getbuffer.py`, which also prints the
+benchmark.
+"""
+import os
+import sys
+import time
+import types
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def _install_stubs():
+    """ Registers the hardware modules the driver imports, doing nothing """
+    spidev = types.ModuleType('spidev')
+    spidev.SpiDev = lambda *args: types.SimpleNamespace(writebytes=lambda data: None,
+                                                        writebytes2=lambda data: None)
+    gpio = types.ModuleType('RPi.GPIO')
+    gpio.HIGH, gpio.LOW, gpio.BCM, gpio.OUT, gpio.IN = 1, 0, 11, 0, 1
+    gpio.output = gpio.setup = gpio.setmode = gpio.setwarnings = gpio.cleanup = lambda *args: None
+    gpio.input = lambda pin: 0
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    for name, module in (('spidev', spidev), ('RPi', rpi), ('RPi.GPIO', gpio)):
+        sys.modules.setdefault(name, module)
+
+
+_install_stubs()
+from PIL import Image, ImageDraw
+from stenogotchi.ui.hw.libs.waveshare.v2 import epd2in13_V2
+
+
+def reference_getbuffer(width, height, image):
+    """ The nested-loop getbuffer the driver shipped with, kept as the reference output """
+    if width % 8 == 0:
+        linewidth = width // 8
+    else:
+        linewidth = width // 8 + 1
+
+    buf = [0xFF] * (linewidth * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+
+    if (imwidth == width and imheight == height):
+        # print("Vertical")
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    x = imwidth - x
+                    buf[x // 8 + y * linewidth] &= ~(0x80 >> (x % 8))
+    elif (imwidth == height and imheight == width):
+        # print("Horizontal")
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    newy = imwidth - newy - 1
+                    buf[newx // 8 + newy * linewidth] &= ~(0x80 >> (y % 8))
+    return bytes(buf)
+
+
+def random_frame(rng, size, mode='1'):
+    """ Returns a frame of rectangles and text like the ones the UI draws """
+    image = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(image)
+    for _ in range(30):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(40), y + rng.randrange(40)), fill=rng.randrange(256))
+    draw.text((5, 5), 'Stenogotchi (^_^)', fill=0)
+    return image.convert(mode)
+
+
+def noise_frame(rng, size):
+    return Image.frombytes('1', size, bytes(rng.getrandbits(8) for _ in range((size[0] + 7) // 8 * size[1])))
+
+
+def make_epd(width, height):
+    epd = epd2in13_V2.EPD()
+    epd.width, epd.height = width, height
+    return epd
+
+
+class TestGetbuffer(unittest.TestCase):
+    # (panel width, panel height) besides the real 122x250 one. Widths are never a multiple of 8,
+    # for those the reference writes the first pixel of a line past its end
+    ODD_PANELS = ((13, 37), (7, 9), (101, 3))
+
+    def assertSameBuffer(self, epd, image):
+        expected = reference_getbuffer(epd.width, epd.height, image)
+        self.assertEqual(bytes(epd.getbuffer(image)), expected, (epd.width, epd.height, image.size, image.mode))
+
+    def test_landscape(self):
+        rng = random.Random(0)
+        epd = make_epd(epd2in13_V2.EPD_WIDTH, epd2in13_V2.EPD_HEIGHT)
+        size = (epd.height, epd.width)
+        self.assertEqual(size, (250, 122))
+        for mode in ('1', 'L', 'RGB'):
+            for _ in range(10):
+                self.assertSameBuffer(epd, random_frame(rng, size, mode))
+        for _ in range(20):
+            self.assertSameBuffer(epd, noise_frame(rng, size))
+
+    def test_portrait(self):
+        rng = random.Random(1)
+        epd = make_epd(epd2in13_V2.EPD_WIDTH, epd2in13_V2.EPD_HEIGHT)
+        size = (epd.width, epd.height)
+        self.assertEqual(size, (122, 250))
+        for mode in ('1', 'L', 'RGB'):
+            for _ in range(10):
+                self.assertSameBuffer(epd, random_frame(rng, size, mode))
+        for _ in range(20):
+            self.assertSameBuffer(epd, noise_frame(rng, size))
+
+    def test_odd_sizes(self):
+        rng = random.Random(2)
+        for width, height in self.ODD_PANELS:
+            epd = make_epd(width, height)
+            for size in ((width, height), (height, width)):
+                for _ in range(20):
+                    self.assertSameBuffer(epd, noise_frame(rng, size))
+
+    def test_blank_and_full(self):
+        epd = make_epd(epd2in13_V2.EPD_WIDTH, epd2in13_V2.EPD_HEIGHT)
+        for size in ((250, 122), (122, 250)):
+            for color in (0, 255):
+                self.assertSameBuffer(epd, Image.new('1', size, color))
+
+    def test_mismatched_size_is_blank(self):
+        epd = make_epd(epd2in13_V2.EPD_WIDTH, epd2in13_V2.EPD_HEIGHT)
+        self.assertSameBuffer(epd, Image.new('1', (100, 100), 0))
+
+    def test_faster_than_reference(self):
+        fps = benchmark(frames=20)
+        for orientation in ('landscape', 'portrait'):
+            self.assertGreater(fps[orientation, 'getbuffer'], fps[orientation, 'reference'], orientation)
+
+
+def benchmark(frames=200):
+    """
+    Prints the frames per second each implementation packs for both orientations and returns
+    them as {(orientation, name): fps}.
+    """
+    fps = {}
+    rng = random.Random(0)
+    epd = make_epd(epd2in13_V2.EPD_WIDTH, epd2in13_V2.EPD_HEIGHT)
+    implementations = (
+        ('reference', lambda image: reference_getbuffer(epd.width, epd.height, image), max(1, frames // 20)),
+        ('getbuffer', epd.getbuffer, frames),
+    )
+    for orientation, size in (('landscape', (250, 122)), ('portrait', (122, 250))):
+        image = random_frame(rng, size)
+        for name, getbuffer, count in implementations:
+            started = time.perf_counter()
+            for _ in range(count):
+                getbuffer(image)
+            took = (time.perf_counter() - started) / count
+            print("%-9s %-9s %8.3f ms/frame %8.0f fps" % (orientation, name, took * 1000, 1 / took))
+            fps[orientation, name] = 1 / took
+    return fps
+
+
+if __name__ == '__main__':
+    benchmark()
+    unittest.main()